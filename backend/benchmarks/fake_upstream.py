@@ -0,0 +1,229 @@
+# Local stand-in for ORS and Nominatim : same endpoints and response shapes, configurable latency, errors and rate limit
+#
+#   python -m backend.benchmarks.fake_upstream --port 8081 --latency 0.2 --error-rate 0.02 --rate-limit 40
+#   ORS_BASE_URL=http://localhost:8081 NOMINATIM_BASE_URL=http://localhost:8081 uvicorn backend.main:app
+#
+# Routes follow straight L-shaped "streets" between points, answers are deterministic for a given seed.
+
+import argparse
+import asyncio
+import hashlib
+import random
+import threading
+import time
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from backend.utils.constants import ROAD_GRAPH_DEFAULT_SPEED
+from backend.utils.geometry import haversine_to_many, path_length
+
+SPEED_MS = ROAD_GRAPH_DEFAULT_SPEED / 3.6
+POINT_SPACING = 0.0003 # Degrees between the intermediate points of a street
+SEARCH_CENTER = (45.5, -73.6) # Geocoded addresses land around here
+
+class RateLimiter:
+    "Token bucket of rate_limit requests per minute, like the ORS quotas. Returns the seconds to wait, 0 if allowed."
+
+    def __init__(self, rate_limit):
+        self.rate = rate_limit / 60
+        self.tokens = float(rate_limit)
+        self.capacity = float(rate_limit)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+def street(origin, destination):
+    "[lon, lat] points from origin to destination, along the longitude first then the latitude."
+    (lon1, lat1), (lon2, lat2) = origin, destination
+    corner = (lon2, lat1)
+    line = []
+    for (a_lon, a_lat), (b_lon, b_lat) in ((origin, corner), (corner, destination)):
+        steps = max(1, int(max(abs(b_lon - a_lon), abs(b_lat - a_lat)) / POINT_SPACING))
+        line.extend([a_lon + (b_lon - a_lon) * k / steps, a_lat + (b_lat - a_lat) * k / steps] for k in range(steps))
+    line.append([lon2, lat2])
+    return line
+
+def street_distance(origin, destination):
+    "Length in meters of street(origin, destination)."
+    (lon1, lat1), (lon2, lat2) = origin, destination
+    return float(haversine_to_many(lat1, lon1, [lat1], [lon2])[0] + haversine_to_many(lat1, lon2, [lat2], [lon2])[0])
+
+def optimization(body):
+    "Nearest neighbour tour of the jobs, each job going to the vehicle starting closest to it."
+    vehicles = body["vehicles"]
+    jobs = {job["id"]: job["location"] for job in body["jobs"]}
+    assigned = {vehicle["id"]: [] for vehicle in vehicles}
+    for job_id, location in jobs.items():
+        closest = min(vehicles, key=lambda v: street_distance(v.get("start", location), location))
+        assigned[closest["id"]].append(job_id)
+
+    routes, total_distance, total_duration = [], 0, 0
+    for vehicle in vehicles:
+        if not assigned[vehicle["id"]]:
+            continue
+        position = vehicle.get("start") or jobs[assigned[vehicle["id"]][0]]
+        distance = 0.0
+        steps = [{"type": "start", "location": position, "arrival": 0, "duration": 0, "distance": 0}]
+        todo = list(assigned[vehicle["id"]])
+        while todo:
+            job_id = min(todo, key=lambda j: street_distance(position, jobs[j]))
+            todo.remove(job_id)
+            distance += street_distance(position, jobs[job_id])
+            position = jobs[job_id]
+            duration = round(distance / SPEED_MS)
+            steps.append({"type": "job", "id": job_id, "job": job_id, "location": position,
+                          "arrival": duration, "duration": duration, "distance": round(distance)})
+        if "end" in vehicle:
+            distance += street_distance(position, vehicle["end"])
+            position = vehicle["end"]
+        duration = round(distance / SPEED_MS)
+        steps.append({"type": "end", "location": position, "arrival": duration, "duration": duration, "distance": round(distance)})
+        routes.append({"vehicle": vehicle["id"], "cost": duration, "distance": round(distance),
+                       "duration": duration, "service": 0, "steps": steps})
+        total_distance += round(distance)
+        total_duration += duration
+
+    return {
+        "code": 0,
+        "summary": {"cost": total_duration, "routes": len(routes), "unassigned": 0,
+                    "distance": total_distance, "duration": total_duration},
+        "unassigned": [],
+        "routes": routes,
+    }
+
+def directions(body):
+    "GeoJSON directions through every coordinate, skipped segments are straight lines as with ORS."
+    coordinates = body["coordinates"]
+    skipped = set(body.get("skip_segments", []))
+    line, way_points, segments = [list(coordinates[0])], [0], []
+    for number, (origin, destination) in enumerate(zip(coordinates, coordinates[1:]), start=1):
+        leg = [list(origin), list(destination)] if number in skipped else street(origin, destination)
+        line.extend(leg[1:])
+        way_points.append(len(line) - 1)
+        distance = path_length([(lat, lon) for lon, lat in leg])
+        segments.append({"distance": round(distance, 1), "duration": round(distance / SPEED_MS, 1), "steps": []})
+    distance = sum(segment["distance"] for segment in segments)
+    lons, lats = [p[0] for p in line], [p[1] for p in line]
+    return {
+        "type": "FeatureCollection",
+        "bbox": [min(lons), min(lats), max(lons), max(lats)],
+        "features": [{
+            "type": "Feature",
+            "bbox": [min(lons), min(lats), max(lons), max(lats)],
+            "geometry": {"type": "LineString", "coordinates": line},
+            "properties": {
+                "segments": segments,
+                "summary": {"distance": round(distance, 1), "duration": round(distance / SPEED_MS, 1)},
+                "way_points": way_points,
+            },
+        }],
+        "metadata": {"service": "routing", "query": {"coordinates": coordinates, "profile": "driving-car", "format": "geojson"}},
+    }
+
+def matrix(body):
+    "Street distances and durations between the sources and destinations."
+    locations = body["locations"]
+    sources = body.get("sources") or list(range(len(locations)))
+    destinations = body.get("destinations") or list(range(len(locations)))
+    distances = np.array([[street_distance(locations[i], locations[j]) for j in destinations] for i in sources])
+    return {
+        "distances": np.round(distances, 2).tolist(),
+        "durations": np.round(distances / SPEED_MS, 2).tolist(),
+        "sources": [{"location": locations[i]} for i in sources],
+        "destinations": [{"location": locations[j]} for j in destinations],
+        "metadata": {"service": "matrix", "query": {"profile": "driving-car"}},
+    }
+
+def search(query, limit):
+    "A single result near SEARCH_CENTER, always the same for the same query."
+    if not query.strip():
+        return []
+    digest = hashlib.sha256(query.encode("utf-8")).digest()
+    lat = SEARCH_CENTER[0] + (digest[0] - 128) / 2560
+    lon = SEARCH_CENTER[1] + (digest[1] - 128) / 2560
+    place_id = int.from_bytes(digest[2:6], "big")
+    return [{
+        "place_id": place_id, "osm_type": "way", "osm_id": place_id,
+        "lat": f"{lat:.7f}", "lon": f"{lon:.7f}",
+        "class": "building", "type": "house", "importance": 0.5,
+        "display_name": query,
+        "boundingbox": [f"{lat - 0.0001:.7f}", f"{lat + 0.0001:.7f}", f"{lon - 0.0001:.7f}", f"{lon + 0.0001:.7f}"],
+    }][:max(limit, 0)]
+
+def create_app(latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None, seed=0) -> FastAPI:
+    """
+    The stand-in service.
+    latency = seconds before each answer, plus a uniform random jitter
+    error_rate = share of requests answered with a 503
+    rate_limit = requests per minute and per endpoint before answering 429 with Retry-After, None for no limit
+    """
+    app = FastAPI(title="ORS/Nominatim stand-in")
+    rng = random.Random(seed)
+    limiters = {}
+
+    async def answer(endpoint, build):
+        if rate_limit is not None:
+            wait = limiters.setdefault(endpoint, RateLimiter(rate_limit)).acquire()
+            if wait:
+                return JSONResponse({"error": {"code": 429, "message": "Rate limit exceeded"}},
+                                    status_code=429, headers={"Retry-After": str(max(1, round(wait)))})
+        await asyncio.sleep(latency + rng.uniform(0, jitter))
+        if rng.random() < error_rate:
+            return JSONResponse({"error": {"code": 503, "message": "Service unavailable"}}, status_code=503)
+        return JSONResponse(build())
+
+    @app.post("/optimization")
+    async def post_optimization(request: Request):
+        body = await request.json()
+        return await answer("optimization", lambda: optimization(body))
+
+    @app.post("/v2/directions/{profile}/geojson")
+    async def post_directions(profile: str, request: Request):
+        body = await request.json()
+        return await answer("directions", lambda: directions(body))
+
+    @app.post("/v2/matrix/{profile}")
+    async def post_matrix(profile: str, request: Request):
+        body = await request.json()
+        return await answer("matrix", lambda: matrix(body))
+
+    @app.get("/search")
+    async def get_search(q: str = "", limit: int = 10):
+        return await answer("search", lambda: search(q, limit))
+
+    return app
+
+def make_transport(**settings):
+    "httpx transport serving the stand-in in-process, settings are the create_app ones."
+    return httpx.ASGITransport(app=create_app(**settings))
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local ORS/Nominatim stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds, up to this")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 503")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Requests per minute and per endpoint before 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.jitter, args.error_rate, args.rate_limit, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# End-to-end load benchmark : synthetic database, app driven in-process, latency percentiles per endpoint
+#
+#   python -m backend.benchmarks.load --rows 50000 --requests 200 --concurrency 16 --out bench.json
+#
+# ORS and Nominatim are answered in-process by the stand-in of fake_upstream, so the numbers measure
+# the backend itself and stay comparable between commits. Caches live in a temporary directory.
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+CENTER = (45.45, -73.62)
+
+def scenarios(rng):
+    """
+    Named request builders, each returns (method, url, kwargs) for a random start
+    so the requests do not all hit the same cache entries.
+    """
+    def start():
+        return CENTER[0] + rng.uniform(-0.02, 0.02), CENTER[1] + rng.uniform(-0.03, 0.03)
+
+    def optimize(solver):
+        def build():
+            lat, lon = start()
+            return "POST", "/profiles/optimize", {"json": {
+                "start_lat": lat, "start_lon": lon, "filters": {},
+                "solver": solver, "max_stops": 45, "geometry": "polyline",
+            }}
+        return build
+
+    def profiles():
+        lat, lon = start()
+        return "GET", "/profiles/", {"params": {"near_lat": lat, "near_lon": lon, "radius_m": 1000, "limit": 50}}
+
+    def export():
+        return "GET", "/profiles/export", {"params": {"score_min": rng.randint(1, 5)}}
+
+    def geocode():
+        return "GET", "/geocode", {"params": {"q": f"{rng.randint(1, 9999)} rue Sherbrooke Ouest, Montréal"}}
+
+    return {
+        "optimize_ors": optimize("ors"),
+        "optimize_local": optimize("local"),
+        "profiles_near": profiles,
+        "profiles_export": export,
+        "geocode": geocode,
+    }
+
+def summarize(latencies, errors, elapsed):
+    "Latency percentiles in milliseconds and throughput of one scenario."
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+        "mean_ms": round(float(ms.mean()), 2) if len(ms) else None,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+
+async def run_scenario(client, build, requests, concurrency):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        method, url, kwargs = build()
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return summarize(latencies, errors, time.perf_counter() - t0)
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="mapper-bench-")
+    os.environ.setdefault("ORS_API_KEY", "benchmark")
+
+    # Imported after the environment is set, the app reads it at import time
+    import backend.database as db_module
+    import backend.utils.http_client as http_client
+    from backend.benchmarks.fake_upstream import make_transport
+    from backend.benchmarks.synthetic_db import build_synthetic_database
+    from backend.utils.matrix_store import matrix_store
+    from backend.utils.ors_cache import ors_cache, directions_leg_cache
+    from backend.utils.ors_scheduler import ors_scheduler
+    from backend.utils.warmup import request_log
+    from backend.main import app
+
+    for cache, name in ((ors_cache, "ors.sqlite"), (directions_leg_cache, "legs.sqlite"), (request_log, "requests.sqlite")):
+        cache.path = os.path.join(workdir, name)
+    matrix_store.directory = os.path.join(workdir, "matrices")
+    if not args.ors_quotas:
+        # The free plan quotas would make the ORS scenarios measure the scheduler's waits
+        ors_scheduler.quotas.clear()
+
+    db_path = os.path.join(workdir, "profiles.db")
+    t0 = time.perf_counter()
+    build_synthetic_database(db_path, args.rows, center=CENTER, seed=args.seed).dispose()
+    print(f"Synthetic database : {args.rows} profiles in {time.perf_counter() - t0:.1f}s")
+    db_module.set_database_path(db_path)
+
+    http_client._client = httpx.AsyncClient(transport=make_transport(
+        latency=args.upstream_latency, error_rate=args.upstream_error_rate,
+        rate_limit=args.upstream_rate_limit, seed=args.seed))
+
+    builders = scenarios(random.Random(args.seed))
+    selected = args.scenarios or list(builders)
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        for name in selected:
+            results[name] = await run_scenario(client, builders[name], args.requests, args.concurrency)
+            print(f"{name} : {results[name]}")
+    await http_client.close_async_client()
+
+    return {
+        "commit": current_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "params": {"rows": args.rows, "requests": args.requests, "concurrency": args.concurrency,
+                   "upstream_latency": args.upstream_latency, "upstream_error_rate": args.upstream_error_rate,
+                   "upstream_rate_limit": args.upstream_rate_limit, "ors_quotas": args.ors_quotas, "seed": args.seed},
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark of the mapper backend on a synthetic database")
+    parser.add_argument("--rows", type=int, default=10000, help="Synthetic profiles (1k to 200k)")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="Seconds before each ORS/Nominatim answer")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0, help="Share of ORS/Nominatim calls answered with a 503")
+    parser.add_argument("--upstream-rate-limit", type=float, default=None, help="ORS/Nominatim requests per minute and per endpoint before 429")
+    parser.add_argument("--ors-quotas", action="store_true", help="Keep the ORS rate limits and daily budgets of the scheduler")
+    parser.add_argument("--scenarios", nargs="*", choices=list(scenarios(random.Random())), help="Default : all")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="JSON report file, printed if omitted")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.out}")
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Synthetic profiles database for the benchmarks, same schema as the real one
+
+import random
+
+from sqlalchemy import create_engine, insert
+
+from backend.database.schema import Base
+from backend.database.models import Profile
+from backend.database.spatial import ensure_spatial_index
+from backend.utils.constants import VALID_LEANS, VALID_NATIONALITIES
+
+NBHOODS = ["Loyola", "Notre-Dame-de-Grâce", "Côte-des-Neiges", "Snowdon", "Westmount"]
+LANGUAGES = ["Français", "Anglais", "Espagnol", "Arabe", "Italien"]
+PERSONALITIES = ["Analytique", "Sociable", "Réservé", "Engagé"]
+INSERT_CHUNK = 5000
+
+def build_synthetic_database(path, rows, center=(45.45, -73.62), spread=(0.03, 0.05), seed=0):
+    """
+    Creates a SQLite database at path holding rows random profiles scattered
+    around center (lat, lon), spread being the (lat, lon) half-width in degrees.
+    Returns the engine.
+    """
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    ensure_spatial_index(engine)
+
+    with engine.begin() as conn:
+        for first in range(0, rows, INSERT_CHUNK):
+            conn.execute(insert(Profile), [
+                {
+                    "uniqueid": f"bench-{i}",
+                    "name": f"Profile {i}",
+                    "age": rng.randint(18, 95),
+                    "nbhood": rng.choice(NBHOODS),
+                    "score_vote": rng.randint(1, 10),
+                    "preferred_language": rng.choice(LANGUAGES),
+                    "native_language": rng.choice(LANGUAGES),
+                    "origin": rng.choice(VALID_NATIONALITIES),
+                    "political_lean": rng.choice(VALID_LEANS),
+                    "personality": rng.choice(PERSONALITIES),
+                    "political_scale": "Lorem ipsum dolor sit amet " * rng.randint(1, 5),
+                    "ideal_process": "Porte-à-porte",
+                    "strategic_profile": "Indécis",
+                    "suggested_arguments": "Consectetur adipiscing elit " * rng.randint(1, 8),
+                    "picture_url": None,
+                    "latitude": center[0] + rng.uniform(-spread[0], spread[0]),
+                    "longitude": center[1] + rng.uniform(-spread[1], spread[1]),
+                }
+                for i in range(first, min(first + INSERT_CHUNK, rows))
+            ])
+    return engine
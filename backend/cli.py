@@ -2,13 +2,17 @@ from backend.database.operations import parse_database_field, import_data_from_c
 from backend.database.llm_operations import update_database_nationalities, llm_normalize_field_cached
 from backend.database.models import Profile
 from backend.utils.security import list_admins, create_admin, remove_admin
-from backend.utils.geo import update_profiles_latlon_from_csv, test_map
+from backend.utils.geo import test_map
+from backend.utils.geocoding import update_profiles_latlon_from_csv
+from backend.utils.warmup import warm_up
+from backend.database import set_database_path
 from backend.utils.constants import CSV_PATH, DATABASE_PATH, DATABASE_URL, VALID_LEANS, VALID_NATIONALITIES
 from backend.main import run_fastapi_app
 
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine
 
+import asyncio
 import os
 
 def launch_cli():
@@ -21,6 +25,7 @@ def launch_cli():
 3 : remove admin account
 4 : manage database
 5 : test folium optimized_route
+6 : warm up route caches from the request log
 else : start app
 -> """):
             case "1":
@@ -84,6 +89,9 @@ else : back to menu
 
             case "5":
                 test_map()
+            case "6":
+                set_database_path(DATABASE_PATH)
+                print(f"{asyncio.run(warm_up(pause=0))} routes precomputed")
             case _:
                 print("Starting main app")
                 init_loop = False
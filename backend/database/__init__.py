@@ -1,13 +1,101 @@
 # Creates the engine and Session
 
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
+from backend.utils.constants import (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, SQLITE_BUSY_TIMEOUT,
+                                     SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE)
+
 SessionLocal = None  # Needed to expose at module level
 engine = None
+database_path = None # File of the loaded database
+
+def create_sqlite_engine(db_path: str):
+    """
+    Engine of the app database : pooled connections usable from any thread, each one
+    set up in WAL mode so reads don't wait behind a write, with a larger page cache,
+    memory-mapped reads and temporary tables in memory.
+    """
+    new_engine = create_engine(
+        f"sqlite:///{db_path}",
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+    @event.listens_for(new_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL") # Safe with WAL, only the last commits can be lost on power failure
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    return new_engine
+
+def release_database():
+    """
+    Writes the WAL of the current database back into its file and closes its connections,
+    no database is loaded afterwards. Call it before the database file is overwritten
+    (download, upload) : stale WAL pages would otherwise be applied to the new file.
+    """
+    global engine, SessionLocal, database_path
+    if engine is not None:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        engine.dispose()
+    engine = None
+    SessionLocal = None
+    database_path = None
+
+def _discard_engine():
+    "Drops the engine without a checkpoint, for a database that failed to load."
+    global engine, SessionLocal, database_path
+    if engine is not None:
+        engine.dispose()
+    engine = None
+    SessionLocal = None
+    database_path = None
 
 def set_database_path(db_path: str):
-    global engine, SessionLocal
-    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    global engine, SessionLocal, database_path
+    release_database()
+    engine = create_sqlite_engine(db_path)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    print(f"Switched database to {db_path}.")
\ No newline at end of file
+    database_path = db_path
+    from backend.database.spatial import ensure_spatial_index # Imports the models, which need this package
+    ensure_spatial_index(engine)
+    print(f"Switched database to {db_path}.")
+
+def replace_database(new_file: str, db_path: str):
+    """
+    Moves a downloaded or uploaded database from new_file to db_path and loads it.
+    The loaded database keeps serving until then, it is only released when db_path is its file.
+    If the new database can't be loaded, the previous one is put back and reloaded.
+    """
+    previous = database_path
+    backup = None
+    if previous is not None and os.path.abspath(previous) == os.path.abspath(db_path):
+        release_database()
+        backup = db_path + ".previous"
+        os.replace(db_path, backup)
+    for suffix in ("-wal", "-shm"): # Nothing has it open, a leftover WAL would be applied to the new file
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    try:
+        os.replace(new_file, db_path)
+        set_database_path(db_path)
+    except Exception:
+        _discard_engine()
+        if backup is not None:
+            os.replace(backup, db_path)
+        if previous is not None:
+            set_database_path(previous)
+        raise
+    if backup is not None:
+        os.remove(backup)
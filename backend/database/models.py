@@ -79,6 +79,14 @@ class ConnectionLog(Base):
     user = relationship("User", back_populates="logs")
     device = relationship("Device", back_populates="logs")
 
+class GeocodeCache(Base):
+    __tablename__ = "geocode_cache"
+
+    address = Column(String, primary_key=True) # Normalized address
+    latitude = Column(Float) # Null when the address couldn't be found
+    longitude = Column(Float)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class FieldMetadata(Base):
     __tablename__ = "field_metadata"
     field_name = Column(String, primary_key=True, index=True)
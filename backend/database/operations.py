@@ -14,11 +14,13 @@ from pandas import read_csv
 from backend.utils.constants import *
 from backend.database.schema import Base
 from backend.database.models import Profile, User
+from backend.database.spatial import ensure_spatial_index
 
 def create_data_base(file_path:str = "backend/database/electoral_app.db"):
     "Generate a db file for SQLite."
     engine = create_engine(f"sqlite:///{Path(file_path)}", echo=True)
     Base.metadata.create_all(engine)
+    ensure_spatial_index(engine)
     print("Created database")
     return(engine)
 
@@ -0,0 +1,33 @@
+# Column-projected profile queries : the routing and the map markers only read a few columns
+
+from sqlalchemy.orm import Session
+
+import backend.database as db_module
+from backend.database.models import Profile
+
+# Everything the routing (id, coordinates) and the map markers read, nothing else is loaded
+MARKER_COLUMNS = (
+    Profile.id, Profile.latitude, Profile.longitude,
+    Profile.name, Profile.age, Profile.nbhood, Profile.personality, Profile.suggested_arguments,
+    Profile.preferred_language, Profile.origin, Profile.political_scale, Profile.ideal_process,
+    Profile.strategic_profile, Profile.picture_url,
+)
+
+def marker_query(db: Session):
+    """
+    Query of the MARKER_COLUMNS, filterable like db.query(Profile).
+    Its rows are plain named tuples (row.id, row.latitude, ...) : no ORM object,
+    identity map entry or attribute instrumentation per profile.
+    """
+    return db.query(*MARKER_COLUMNS)
+
+def load_marker_rows(profile_ids) -> dict:
+    "{profile id: marker row} of the given profiles, in a single query."
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return {}
+    db = db_module.SessionLocal()
+    try:
+        return {row.id: row for row in marker_query(db).filter(Profile.id.in_(profile_ids))}
+    finally:
+        db.close()
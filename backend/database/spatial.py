@@ -0,0 +1,123 @@
+# R*Tree spatial index on the profiles coordinates
+
+from math import cos, radians
+from sqlalchemy import inspect, select, table, column, and_
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.exc import OperationalError
+
+from backend.database.models import Profile
+from backend.utils.constants import NEAREST_START_RADIUS, NEAREST_MAX_RADIUS
+from backend.utils.geometry import haversine_to_many
+
+RTREE_TABLE = "profiles_rtree"
+METERS_PER_DEGREE = 111320.0
+
+profiles_rtree = table(RTREE_TABLE, column("id"), column("min_lat"), column("max_lat"), column("min_lon"), column("max_lon"))
+
+_indexed_engines = {} # engine url -> R*Tree available ?
+
+def ensure_spatial_index(engine: Engine) -> bool:
+    """
+    Creates the R*Tree virtual table and the triggers keeping it in sync with `profiles`,
+    then indexes the profiles missing from it. Safe to call on every start.
+    Returns False if the profiles table doesn't exist yet or SQLite was built without R*Tree.
+    """
+    if not inspect(engine).has_table(Profile.__tablename__):
+        return False
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+            )
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_insert AFTER INSERT ON profiles
+                WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+                    INSERT INTO {RTREE_TABLE} VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+                END""")
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_update AFTER UPDATE OF latitude, longitude ON profiles BEGIN
+                    DELETE FROM {RTREE_TABLE} WHERE id = old.id;
+                    INSERT INTO {RTREE_TABLE} SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+                    WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+                END""")
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_delete AFTER DELETE ON profiles BEGIN
+                    DELETE FROM {RTREE_TABLE} WHERE id = old.id;
+                END""")
+            # Rows written before the triggers existed
+            conn.exec_driver_sql(f"""
+                INSERT INTO {RTREE_TABLE}
+                SELECT id, latitude, latitude, longitude, longitude FROM profiles
+                WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND id NOT IN (SELECT id FROM {RTREE_TABLE})""")
+    except OperationalError as e:
+        print(f"WARN Spatial index unavailable, falling back to column scans: {e}")
+        _indexed_engines[str(engine.url)] = False
+        return False
+    _indexed_engines[str(engine.url)] = True
+    return True
+
+def has_spatial_index(engine: Engine) -> bool:
+    key = str(engine.url)
+    if key not in _indexed_engines:
+        _indexed_engines[key] = inspect(engine).has_table(RTREE_TABLE)
+    return _indexed_engines[key]
+
+def bbox_filter(query, min_lat, min_lon, max_lat, max_lon):
+    "Restricts a Profile query to a bounding box, answered by the R*Tree when available."
+    if has_spatial_index(query.session.get_bind()):
+        ids_in_box = select(profiles_rtree.c.id).where(
+            profiles_rtree.c.max_lat >= min_lat, profiles_rtree.c.min_lat <= max_lat,
+            profiles_rtree.c.max_lon >= min_lon, profiles_rtree.c.min_lon <= max_lon,
+        )
+        return query.filter(Profile.id.in_(ids_in_box))
+    return query.filter(and_(
+        Profile.latitude.between(min_lat, max_lat),
+        Profile.longitude.between(min_lon, max_lon),
+    ))
+
+def distance_order(lat, lon):
+    """
+    SQL expression ranking profiles by distance from (lat, lon).
+    Squared equirectangular distance : plain arithmetic SQLite can evaluate,
+    exact enough to rank stops at city scale.
+    """
+    lon_scale = cos(radians(lat))
+    dlat = Profile.latitude - lat
+    dlon = (Profile.longitude - lon) * lon_scale
+    return dlat * dlat + dlon * dlon
+
+def radius_bbox(lat, lon, radius_m):
+    "Bounding box (min_lat, min_lon, max_lat, max_lon) enclosing a circle."
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(cos(radians(lat)), 1e-6))
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+def profiles_within_radius(query, lat, lon, radius_m):
+    """
+    Profiles of a query within radius_m meters of (lat, lon).
+    The index narrows the search to the enclosing box, exact distances do the rest.
+    Returns a list of (profile_id, distance_m), closest first.
+    """
+    rows = bbox_filter(query, *radius_bbox(lat, lon, radius_m)).with_entities(
+        Profile.id, Profile.latitude, Profile.longitude
+    ).all()
+    if not rows:
+        return []
+    ids, lats, lons = zip(*rows)
+    distances = haversine_to_many(lat, lon, lats, lons)
+    ranked = sorted(zip(ids, distances.tolist()), key=lambda item: item[1])
+    return [(profile_id, dist) for profile_id, dist in ranked if dist <= radius_m]
+
+def nearest_profiles(query, lat, lon, k, max_radius_m=NEAREST_MAX_RADIUS):
+    """
+    The k profiles of a query closest to (lat, lon), searched in growing circles
+    until k are found or max_radius_m is reached.
+    Returns a list of (profile_id, distance_m), closest first.
+    """
+    radius = NEAREST_START_RADIUS
+    while True:
+        found = profiles_within_radius(query, lat, lon, radius)
+        # Everything inside the circle is closer than anything outside it
+        if len(found) >= k or radius >= max_radius_m:
+            return found[:k]
+        radius = min(radius * 2, max_radius_m)
@@ -1,10 +1,30 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from backend.utils.routes import utils_routes, auth_routes, admin_routes, profiles_routes, visits_routes, map_routes, database_routes
+from backend.utils.http_client import close_async_client, close_sync_client
+from backend.utils.jobs import job_queue
+from backend.utils.metrics import MetricsMiddleware, metrics_route
+from backend.utils.ors_scheduler import OrsQuotaExceeded
+from backend.utils.warmup import warmup_enabled, delayed_warm_up
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = None
+    if warmup_enabled():
+        warm_up_task = asyncio.create_task(delayed_warm_up())
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await job_queue.stop() # Cancels the route computations still queued or running
+    await close_async_client() # Drops the pooled ORS/Nominatim connections
+    close_sync_client()
 
 def run_fastapi_app():
-    app = FastAPI(title="Electoral Field App API")
+    app = FastAPI(title="Electoral Field App API", lifespan=lifespan)
 
     app.add_middleware(
         CORSMiddleware,
@@ -12,9 +32,16 @@ def run_fastapi_app():
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing"],
     )
+    app.add_middleware(MetricsMiddleware)
+
+    @app.exception_handler(OrsQuotaExceeded)
+    async def ors_quota_exceeded(request: Request, exc: OrsQuotaExceeded):
+        return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
 
     utils_routes.ping_route(app)
+    metrics_route(app)
     app.include_router(auth_routes.router)
     app.include_router(admin_routes.router)
     app.include_router(profiles_routes.router)
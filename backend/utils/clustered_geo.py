@@ -1,100 +1,215 @@
-from sklearn.cluster import KMeans
-from geopy.distance import geodesic
+from sklearn.cluster import MiniBatchKMeans
+import asyncio
 from math import ceil
 
+import numpy as np
+
 from backend.utils.geo import *
+from backend.utils.geometry import centroids, project_to_meters, haversine_matrix, as_latlon_array
+from backend.utils.tsp import solve_tour
+from backend.utils.metrics import timed
+from backend.utils.ors_scheduler import OrsQuotaExceeded
+from backend.utils.constants import ORS_MAX_CONCURRENCY, CLUSTER_MINIBATCH_THRESHOLD, CLUSTER_COARSE_SIZE
 
+@timed("clustering")
 def cluster_points(points, max_cluster_size=50):
     """
-    Cluster points into spatial batches.
+    Cluster points into spatial batches of at most max_cluster_size points.
+    Large inputs are first coarsely split with MiniBatchKMeans, every group is then
+    cut by balanced_bisection.
     Returns: list of clusters, each is list of point indexes.
     """
-    n_clusters = ceil(len(points) / max_cluster_size)
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    coords = [[lon, lat] for lat, lon in points]
-    labels = kmeans.fit_predict(coords)
+    if not len(points):
+        return []
+    xy = project_to_meters(points)
+    indexes = np.arange(len(points))
+    if len(points) <= CLUSTER_MINIBATCH_THRESHOLD:
+        return balanced_bisection(xy, indexes, max_cluster_size)
 
-    clusters = [[] for _ in range(n_clusters)]
-    for idx, label in enumerate(labels):
-        clusters[label].append(idx)
+    n_groups = ceil(len(points) / CLUSTER_COARSE_SIZE)
+    labels = MiniBatchKMeans(n_clusters=n_groups, random_state=42, n_init=3).fit_predict(xy)
+    clusters = []
+    for label in range(n_groups):
+        group = indexes[labels == label]
+        if len(group):
+            clusters.extend(balanced_bisection(xy, group, max_cluster_size))
+    return clusters
 
-    clusters = enforce_max_cluster_size(clusters, max_cluster_size)
+def balanced_bisection(xy, indexes, max_cluster_size=None, n_clusters=None):
+    """
+    Recursive k-d bisection of points into compact clusters of balanced sizes.
+    Each group is cut across its wider side, the two halves get a number of points
+    proportional to the number of clusters they will hold, so sizes differ by at most one point.
+    xy = (N, 2) projected coordinates in meters
+    indexes = point indexes to split
+    max_cluster_size = cluster size cap, gives ceil(n / max_cluster_size) clusters
+    n_clusters = exact number of clusters instead (e.g. one per canvasser)
+    Returns: list of clusters, each is list of point indexes.
+    """
+    indexes = np.asarray(indexes)
+    if n_clusters is None:
+        n_clusters = ceil(len(indexes) / max_cluster_size)
+    clusters = []
+    stack = [(indexes, min(n_clusters, len(indexes)))]
+    while stack:
+        group, group_clusters = stack.pop()
+        if group_clusters <= 1:
+            clusters.append(group.tolist())
+            continue
+        left_clusters = group_clusters // 2
+        n_left = round(len(group) * left_clusters / group_clusters)
+        coords = xy[group]
+        axis = int(np.argmax(coords.max(axis=0) - coords.min(axis=0)))
+        order = np.argpartition(coords[:, axis], n_left)
+        # Right half pushed first so clusters come out west/south first
+        stack.append((group[order[n_left:]], group_clusters - left_clusters))
+        stack.append((group[order[:n_left]], left_clusters))
     return clusters
 
-def enforce_max_cluster_size(clusters, max_cluster_size):
-    new_clusters = []
-    for cluster in clusters:
-        if len(cluster) > max_cluster_size:
-            for i in range(0, len(cluster), max_cluster_size):
-                new_clusters.append(cluster[i:i+max_cluster_size])
-        else:
-            new_clusters.append(cluster)
-    return new_clusters
+@timed("territories")
+def split_team_territories(points, starts):
+    """
+    Splits the points into one balanced territory per canvasser.
+    points = list of (lat, lon)
+    starts = list of (lat, lon), one per canvasser
+    Returns: list of point indexes lists, territories[i] going to starts[i]
+    (empty when there are fewer points than canvassers).
+    """
+    parts = balanced_bisection(project_to_meters(points), np.arange(len(points)), n_clusters=len(starts))
+    parts += [[] for _ in range(len(starts) - len(parts))]
+    if len({tuple(start) for start in starts}) == 1:
+        return parts
+
+    # Greedy assignment, closest (start, territory) pairs first
+    gaps = haversine_matrix(starts, centroids(points, [part for part in parts if part]))
+    territories = [None] * len(starts)
+    free_parts = [part for part in parts if part]
+    taken_starts, taken_parts = set(), set()
+    for flat in np.argsort(gaps, axis=None).tolist():
+        start_idx, part_idx = divmod(flat, gaps.shape[1])
+        if start_idx in taken_starts or part_idx in taken_parts:
+            continue
+        territories[start_idx] = free_parts[part_idx]
+        taken_starts.add(start_idx)
+        taken_parts.add(part_idx)
+    return [territory if territory is not None else [] for territory in territories]
 
-def combine_cluster_routes(start_coord, clusters, points, profile_ids):
+def plan_cluster_tour(start_coord, clusters, points):
     """
-    1. Runs optimization per cluster.
-    2. Order clusters by centroid distance from start.
-    3. Glue all segments in logical order.
+    Orders the clusters as a short open tour over their centroids, from start_coord,
+    and fixes in advance where the route passes from one cluster to the next so that
+    every cluster can still be optimized on its own, concurrently.
+    The exit of a cluster is its stop closest to the next cluster, the next cluster
+    starts from there.
+    Returns (cluster_order, handoffs), handoffs[k] = (start, end) of the k-th visited
+    cluster as (lat, lon), end being None for the last one.
     """
-    cluster_results = []
-    skipped_points = 0
+    if not clusters:
+        return [], []
+    centers = centroids(points, clusters)
+    tour = solve_tour(haversine_matrix([start_coord] + centers.tolist()), start=0)
+    cluster_order = [node - 1 for node in tour[1:]]
+
+    coords = as_latlon_array(points)
+    handoffs = []
+    entry = tuple(start_coord)
+    for current, following in zip(cluster_order, cluster_order[1:]):
+        members = coords[clusters[current]]
+        gaps = haversine_matrix(members, coords[clusters[following]]).min(axis=1)
+        exit_stop = tuple(members[int(np.argmin(gaps))].tolist())
+        handoffs.append((entry, exit_stop))
+        entry = exit_stop
+    handoffs.append((entry, None))
+    return cluster_order, handoffs
 
-    # Build cluster centroids
-    centroids = []
-    for cluster in clusters:
-        lat = sum(points[i][0] for i in cluster) / len(cluster)
-        lon = sum(points[i][1] for i in cluster) / len(cluster)
-        centroids.append((lat, lon))
+async def optimize_cluster_async(idx, cluster, points, profile_ids, start_coord, end_coord=None):
+    """
+    Runs the ORS optimization of a single cluster.
+    start_coord = (lat, lon) the cluster route starts from
+    end_coord = optional (lat, lon) the cluster route must finish at
+    Returns (ordered_points, ordered_ids), or None if the cluster had to be skipped.
+    """
+    cluster_points = [points[i] for i in cluster]
+    cluster_ids = [profile_ids[i] for i in cluster]
 
-    # Sort clusters by distance from start
-    cluster_order = sorted(
-        range(len(clusters)),
-        key=lambda i: geodesic(start_coord, centroids[i]).meters
-    )
+    try:
+        result, id_map = await get_optimized_route_async(start_coord[0],start_coord[1],points=cluster_points,profile_ids=cluster_ids,end_coord=end_coord)
+    except OrsQuotaExceeded:
+        raise # Skipping the cluster would hide it, the whole request fails
+    except Exception as e:
+        print(f"WARN Cluster {idx} failed: {e}")
+        return None
+    return parse_cluster_result(idx, result, id_map, cluster_points)
 
-    full_ordered_points = [start_coord]
+def parse_cluster_result(idx, result, id_map, cluster_points):
+    """
+    Reads the visiting order of a cluster out of its optimization result.
+    Returns (ordered_points, ordered_ids), or None if the result is unusable.
+    """
+    if result is None or "routes" not in result or not result["routes"]:
+        print(f"WARN Cluster {idx} returned no route. Skipping.")
+        return None
 
-    for idx in cluster_order:
-        cluster = clusters[idx]
-        cluster_points = [points[i] for i in cluster]
-        cluster_ids = [profile_ids[i] for i in cluster]
+    steps = result["routes"][0].get("steps", [])
+    if not steps:
+        print(f"WARN Cluster {idx} has no valid steps. Skipping.")
+        return None
 
-        try:
-            result, id_map = get_optimized_route(start_coord[0],start_coord[1],points=cluster_points,profile_ids=cluster_ids)
-        except Exception as e:
-            print(f"WARN Cluster {idx} failed: {e}")
-            skipped_points += len(cluster)
-            continue
+    ordered = []
+    ordered_ids = []
 
-        if result is None or "routes" not in result or not result["routes"]:
-            print(f"WARN Cluster {idx} returned no route. Skipping.")
-            skipped_points += len(cluster)
-            continue
+    for step in steps:
+        if step["type"] == "job":
+            job_id = step["job"]
+            profile_id = id_map.get(job_id)
+            if profile_id is None:
+                continue
+            ordered.append(cluster_points[job_id - 1])
+            ordered_ids.append(profile_id)
 
-        steps = result["routes"][0].get("steps", [])
-        if not steps:
-            print(f"WARN Cluster {idx} has no valid steps. Skipping.")
-            skipped_points += len(cluster)
-            continue
+    if not ordered:
+        print(f"WARN Cluster {idx} steps all empty. Skipping.")
+        return None
 
-        ordered = []
-        ordered_ids = []
-
-        for step in steps:
-            if step["type"] == "job":
-                job_id = step["job"]
-                profile_id = id_map.get(job_id)
-                if profile_id is None:
-                    continue
-                ordered.append(cluster_points[job_id - 1])
-                ordered_ids.append(profile_id)
-
-        if not ordered:
-            print(f"WARN Cluster {idx} steps all empty. Skipping.")
-            skipped_points += len(cluster)
-            continue
+    return ordered, ordered_ids
+
+async def combine_cluster_routes_async(start_coord, clusters, points, profile_ids, max_concurrency=ORS_MAX_CONCURRENCY, progress=None):
+    """
+    1. Orders the clusters and their handoff stops (plan_cluster_tour).
+    2. Runs optimization per cluster, up to max_concurrency clusters at once, each one
+       starting at the previous cluster's exit stop and ending at its own.
+    3. Glue all segments in logical order.
+    progress = optional job (see backend.utils.jobs) told about each optimized cluster
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    cluster_order, handoffs = plan_cluster_tour(start_coord, clusters, points)
+    if progress:
+        progress.add_work(len(cluster_order))
+
+    async def bounded(idx, handoff):
+        async with semaphore:
+            cluster_result = await optimize_cluster_async(idx, clusters[idx], points, profile_ids, *handoff)
+        if progress:
+            progress.work_done()
+        return cluster_result
 
+    # gather keeps the submission order
+    results = await asyncio.gather(*[bounded(idx, handoff) for idx, handoff in zip(cluster_order, handoffs)])
+    return assemble_cluster_routes(start_coord, clusters, cluster_order, results)
+
+def assemble_cluster_routes(start_coord, clusters, cluster_order, results):
+    """
+    Glues the per-cluster results (in cluster_order) into the full route.
+    Returns (full_ordered_points, cluster_results).
+    """
+    cluster_results = []
+    skipped_points = 0
+    full_ordered_points = [start_coord]
+    for idx, cluster_result in zip(cluster_order, results):
+        if cluster_result is None:
+            skipped_points += len(clusters[idx])
+            continue
+        ordered, ordered_ids = cluster_result
         full_ordered_points += ordered
         cluster_results.append((ordered, ordered_ids))
 
@@ -103,9 +218,20 @@ def combine_cluster_routes(start_coord, clusters, points, profile_ids):
 
     return full_ordered_points, cluster_results
 
-def display_clustered_route(full_ordered_points, cluster_results, start_coord=None):
+async def cluster_directions_async(cluster_idx, points_to_route):
+    "Directions GeoJSON features of a single cluster, empty if ORS failed."
+    try:
+        cluster_geojson = await get_directions_route_async(points_to_route)
+        return cluster_geojson.get("features") or []
+    except OrsQuotaExceeded:
+        raise
+    except Exception as e:
+        print(f"Error getting directions for cluster {cluster_idx}: {e}")
+        return []
+
+async def display_clustered_route_async(full_ordered_points, cluster_results, start_coord=None, max_concurrency=ORS_MAX_CONCURRENCY):
     """
-    Loops through each cluster, retrieves a directions GeoJSON for that cluster,
+    Retrieves a directions GeoJSON for each cluster, up to max_concurrency clusters at once,
     and combines them into a single merged GeoJSON FeatureCollection.
 
     Parameters
@@ -116,41 +242,77 @@ def display_clustered_route(full_ordered_points, cluster_results, start_coord=No
         A list where each element represents a cluster's ordered points
     start_coord : tuple (lat, lon), optional
         Starting coordinate
+    max_concurrency : int, optional
+        Maximum number of concurrent ORS requests
 
     Returns
     -------
     dict
         A combined GeoJSON FeatureCollection with all cluster routes merged
     """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(job):
+        async with semaphore:
+            return await cluster_directions_async(*job)
 
-    combined_geojson = {
+    # gather keeps the cluster order, so the global order of the clusters too
+    results = await asyncio.gather(*[bounded(job) for job in directions_jobs(cluster_results, start_coord)])
+    return {
         "type": "FeatureCollection",
-        "features": []
+        "features": [feature for features in results for feature in features]
     }
 
-    # Track the global order of clusters
+async def stream_clustered_route(start_coord, clusters, points, profile_ids, max_concurrency=ORS_MAX_CONCURRENCY):
+    """
+    Async generator of the clustered route, one cluster at a time in visiting order.
+    Every cluster runs its optimization then its directions as soon as a slot is free,
+    the directions starting from the planned handoff stop, so a cluster never waits for
+    the previous ones and the first clusters are yielded while the last are still computed.
+    Yields (position, ordered_points, ordered_ids, features), skipped clusters are not yielded.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    cluster_order, handoffs = plan_cluster_tour(start_coord, clusters, points)
+
+    async def pipeline(idx, handoff):
+        async with semaphore:
+            cluster_result = await optimize_cluster_async(idx, clusters[idx], points, profile_ids, *handoff)
+        if cluster_result is None:
+            return None
+        ordered_points, ordered_ids = cluster_result
+        async with semaphore:
+            features = await cluster_directions_async(idx, [handoff[0]] + ordered_points)
+        return ordered_points, ordered_ids, features
+
+    tasks = [asyncio.create_task(pipeline(idx, handoff)) for idx, handoff in zip(cluster_order, handoffs)]
+    try:
+        for position, task in enumerate(tasks):
+            cluster_result = await task
+            if cluster_result is not None:
+                yield (position, *cluster_result)
+    finally:
+        # Client gone or error, the remaining ORS calls are useless
+        for task in tasks:
+            task.cancel()
+
+def directions_jobs(cluster_results, start_coord=None):
+    """
+    List of (cluster_idx, points_to_route) directions requests, in cluster order.
+    Each cluster is prefixed with the stop the route arrives from (the start for the
+    first one, the previous cluster's last stop after), so the legs between clusters are drawn too.
+    """
+    jobs = []
+    previous_stop = start_coord
     for cluster_idx, (ordered_points, ordered_ids) in enumerate(cluster_results):
-        # Prepend start coordinate for the first cluster only
-        if cluster_idx == 0 and start_coord:
-            points_to_route = [start_coord] + ordered_points
+        if previous_stop:
+            points_to_route = [previous_stop] + ordered_points
         else:
             points_to_route = ordered_points
+        previous_stop = ordered_points[-1] if ordered_points else previous_stop
 
         # ORS requires lon, lat order, so get_directions_route will handle that
         if len(points_to_route) < 2:
             print(f"Skipping cluster {cluster_idx} - not enough points.")
             continue
-
-        # Get the route for this cluster
-        try:
-            cluster_geojson = get_directions_route(points_to_route)
-
-            # Append features to combined FeatureCollection
-            if cluster_geojson.get("features"):
-                combined_geojson["features"].extend(cluster_geojson["features"])
-
-        except Exception as e:
-            print(f"Error getting directions for cluster {cluster_idx}: {e}")
-            continue
-
-    return combined_geojson
\ No newline at end of file
+        jobs.append((cluster_idx, points_to_route))
+    return jobs
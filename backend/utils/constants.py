@@ -53,6 +53,85 @@ Return the data as it is if you can't.
 - NO BULLET POINTS, NO HEADERS, NO EXTRA TEXT.
 - SEPARATE ENTRIES WITH ;"""
 
+# Database (SQLite engine of the loaded database)
+DB_POOL_SIZE = 10 # Connections kept open in the pool
+DB_MAX_OVERFLOW = 20 # Extra connections opened under load, closed once returned
+DB_POOL_TIMEOUT = 30 # Seconds a request waits for a free connection
+SQLITE_BUSY_TIMEOUT = 5 # Seconds a writer waits for the write lock before "database is locked"
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024 # Bytes of the database file read through memory mapping
+SQLITE_CACHE_SIZE = -16000 # Page cache of each connection, negative = KiB (16 MB)
+
 # Tokens
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
-REFRESH_TOKEN_EXPIRE_DAYS = 7
\ No newline at end of file
+REFRESH_TOKEN_EXPIRE_DAYS = 7
+
+# Routing
+MAX_ORS_STOPS = 45 # Default and maximum stops per route when ORS orders it (nearest first), each one costs budget
+MAX_LOCAL_STOPS = 1000 # Default and maximum stops per route with the local solver, its matrix is N x N
+MAX_TEAM_SIZE = 20 # Canvassers planned in a single /profiles/optimize call
+LOCAL_SOLVER_TIME_BUDGET = 0.5 # Seconds spent improving a locally solved tour
+ORS_MAX_WAYPOINTS = 50 # Max coordinates in a single ORS directions request
+ORS_MATRIX_TILE_SIZE = 50 # Sources (and destinations) per ORS /matrix sub-request
+UNREACHABLE_COST = 1e9 # Matrix cost of a pair ORS couldn't route
+NEAREST_START_RADIUS = 250 # Meters, first circle searched for the nearest profiles (doubled until enough)
+NEAREST_MAX_RADIUS = 50000 # Meters, nearest profiles are never searched further than this
+ORS_MAX_CONCURRENCY = 4 # Clusters sent to ORS at once, keep under the per-minute rate limit
+CLUSTER_MINIBATCH_THRESHOLD = 20000 # Above this many points, MiniBatchKMeans pre-splits before the bisection
+CLUSTER_COARSE_SIZE = 5000 # Points per MiniBatchKMeans group
+
+ROUTE_SIMPLIFY_TOLERANCE = 5 # Meters, default Douglas-Peucker tolerance of the "polyline" geometry mode
+POLYLINE_PRECISION = 5 # Decimals kept by the encoded polyline
+
+# Offline road graph (ROAD_GRAPH_FILE env variable)
+ROAD_GRAPH_DEFAULT_SPEED = 30 # km/h of ways without known speed
+ROAD_GRAPH_SNAP_RADIUS = 500 # Meters, points further than this from a road can't be routed locally
+
+# Route jobs
+JOB_WORKERS = 2 # Route computations running at once, the others wait in the queue
+JOB_MAX_PENDING = 100 # Queued jobs before submissions are refused
+JOB_RESULT_TTL = 600 # Seconds a finished job result stays available
+
+# Route sessions
+ROUTE_SESSION_TTL = 12 * 3600 # Seconds a planned route can be re-planned after its last use, a shift
+ROUTE_SESSION_MAX = 100 # Sessions kept in memory, the least recently used are dropped above
+REPLAN_TIME_BUDGET = 0.05 # Seconds of local search when re-planning, the previous order is already good
+
+# Route warm-up (ROUTE_WARMUP=1 env variable, or the CLI)
+WARMUP_LOG_TTL = 7 * 24 * 3600 # Seconds a logged /profiles/optimize request stays a warm-up candidate
+WARMUP_LOG_MAX_ENTRIES = 500 # Distinct requests remembered
+WARMUP_MAX_REQUESTS = 50 # Most recent requests replayed by a warm-up
+WARMUP_START_DELAY = 10 # Seconds after startup before the warm-up begins
+WARMUP_PAUSE = 2 # Seconds between two replayed requests, leaves ORS quota and CPU to real users
+
+# Metrics (/metrics, Server-Timing headers)
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # Seconds, histogram upper bounds
+
+# Outbound HTTP
+HTTP_TIMEOUT = 30 # Seconds before an ORS/Nominatim call is abandoned
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_MAX_CONNECTIONS = 20 # Pooled connections shared by the whole app
+HTTP_MAX_KEEPALIVE = 10
+HTTP_RETRIES = 3 # Retries on transport errors and 429/5xx answers
+HTTP_BACKOFF_BASE = 0.5 # Seconds, doubled at each retry (with jitter)
+HTTP_BACKOFF_MAX = 8
+HTTP_RETRY_AFTER_MAX = 60 # Seconds, longest Retry-After waited before retrying a 429
+
+# ORS quotas (free plan), the outbound scheduler keeps the calls under them
+ORS_RATE_LIMITS = {"optimization": 40, "directions": 40, "matrix": 40, "search": 60} # Requests per minute, search is Nominatim
+ORS_DAILY_BUDGETS = {"optimization": 500, "directions": 2000, "matrix": 500} # Requests per UTC day
+ORS_BACKGROUND_RESERVE = 0.2 # Share of the daily budgets kept for interactive requests, warm-up stops before
+ORS_SCHEDULER_POLL = 0.05 # Seconds between two checks of a request waiting for its turn
+
+# Geocoding
+NOMINATIM_MIN_INTERVAL = 1.0 # Seconds between Nominatim calls (usage policy : 1 req/s)
+GEOCODE_COMMIT_EVERY = 25 # Geocoded addresses written to the cache per commit
+
+# Caches
+ORS_CACHE_FILE = "ors_cache.sqlite" # In CACHE_PATH
+ORS_CACHE_TTL = 7 * 24 * 3600 # Seconds before a cached ORS response expires
+ORS_CACHE_MAX_ENTRIES = 5000 # Least recently used responses are evicted above this
+MATRIX_STORE_DIR = "matrices" # In CACHE_PATH
+MATRIX_STORE_MAX_BYTES = 1024 * 1024 * 1024 # Stored matrices, the least recently used are deleted above
+MATRIX_STORE_PRECISION = 6 # Decimals of the coordinates keying a matrix, a profile moved further gets a new one
+DIRECTIONS_LEG_CACHE_MAX_ENTRIES = 50000 # Cached legs (geometry between two consecutive stops)
+DIRECTIONS_LEG_PRECISION = 5 # Decimals of the coordinates keying a leg, ~1 m
\ No newline at end of file
@@ -8,8 +8,8 @@ import backend.database as db_module
 from backend.database.models import User, Device
 
 def get_db():
+    "Session of the request, shared by get_current_user and the route (FastAPI caches it per request)."
     db = db_module.SessionLocal()
-    print(str(db_module.SessionLocal.kw['bind'].url))
     try:
         yield db
     finally:
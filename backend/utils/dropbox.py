@@ -2,7 +2,7 @@ import os, json, requests, hashlib
 import secrets
 import string
 from backend.utils.constants import USER_SESSION_PATH
-from backend.database import set_database_path
+from backend.database import replace_database
 from backend.utils.mail import send_email
 
 DROPBOX_APP_KEY = os.getenv("DROPBOX_APP_KEY")
@@ -110,8 +110,14 @@ def user_login(username: str, password: str):
     last_db = sessions[username]["last_db"]
     if last_db:
         local_db = f"/tmp/{username}.db"
-        download_from_dropbox(last_db, local_db)
-        set_database_path(local_db)
+        # Downloaded next to it first, the database in use is only replaced once the download succeeded
+        downloaded = local_db + ".download"
+        try:
+            download_from_dropbox(last_db, downloaded)
+            replace_database(downloaded, local_db)
+        finally:
+            if os.path.exists(downloaded):
+                os.remove(downloaded)
         return local_db
     return None
 
@@ -142,7 +148,11 @@ def reset_password(username: str, email: str) -> None:
 
     print(f"Password change :\n{username}")
 
-def user_upload_db(username: str, password: str, local_db_path: str):
+def user_upload_db(username: str, password: str, uploaded_path: str):
+    """
+    Stores the uploaded database on Dropbox as the user's, then loads it from /tmp/<username>.db.
+    Returns that path. The database in use is left as it was if anything fails before.
+    """
     sessions = load_user_sessions()
     hashed = hash_password(password)
 
@@ -153,9 +163,11 @@ def user_upload_db(username: str, password: str, local_db_path: str):
         raise ValueError("Invalid password")
 
     dropbox_path = f"/databases/{username}.db"
-    upload_to_dropbox(local_db_path, dropbox_path)
+    upload_to_dropbox(uploaded_path, dropbox_path)
 
     sessions[username]["last_db"] = dropbox_path
     save_user_sessions(sessions)
     print(f"Updated DB for {username} at {dropbox_path}")
-    set_database_path(local_db_path)
+    local_db = f"/tmp/{username}.db"
+    replace_database(uploaded_path, local_db)
+    return local_db
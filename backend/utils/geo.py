@@ -1,13 +1,31 @@
 from math import radians, cos, sin, asin, sqrt
-import requests
+import asyncio
+import httpx
 import json
-import csv
-from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
 from backend.database.models import Profile
+from backend.database.projections import load_marker_rows
 import backend.database as db_module
+from backend.utils.constants import LOCAL_SOLVER_TIME_BUDGET, ORS_MAX_WAYPOINTS, DIRECTIONS_LEG_PRECISION
+from backend.utils.http_client import request_with_retry, request_with_retry_sync
+from backend.utils.metrics import timed
+from backend.utils.geometry import haversine_to_many, haversine_matrix, path_length
+from backend.utils.ors_cache import ors_cache, directions_leg_cache
+from backend.utils.tsp import solve_tour
+from backend.utils.road_graph import get_road_graph
+
+# Point these at a stand-in (python -m backend.benchmarks.fake_upstream) to run without the real services,
+# in the environment or the .env file
+load_dotenv()
+ORS_BASE_URL = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org").rstrip("/")
+NOMINATIM_BASE_URL = os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org").rstrip("/")
+
+NOMINATIM_SEARCH_URL = f"{NOMINATIM_BASE_URL}/search"
+ORS_OPTIMIZATION_URL = f"{ORS_BASE_URL}/optimization"
+ORS_DIRECTIONS_URL = f"{ORS_BASE_URL}/v2/directions/driving-car/geojson"
+NOMINATIM_HEADERS = {"User-Agent": "ElectoralApp/1.0"}
 
 def haversine(lat1, lon1, lat2, lon2):
     # rayon de la Terre en km
@@ -20,9 +38,9 @@ def haversine(lat1, lon1, lat2, lon2):
 
 def geocode_address(address):
     
-    url = f"https://nominatim.openstreetmap.org/search"
+    url = NOMINATIM_SEARCH_URL
     params = {"q": address, "format": "json"}
-    response = requests.get(url, params=params)
+    response = request_with_retry_sync("GET", url, params=params)
     response.raise_for_status()
     results = response.json()
     if not results:
@@ -36,14 +54,14 @@ def geocode_address_osm(address: str):
     Use OpenStreetMap Nominatim API to geocode an address.
     Returns (latitude, longitude) as floats, or None if not found.
     """
-    url = "https://nominatim.openstreetmap.org/search"
+    url = NOMINATIM_SEARCH_URL
     params = {
         "q": address,
         "format": "json",
         "addressdetails": 1,
         "limit": 1
     }
-    response = requests.get(url, params=params, headers={"User-Agent": "ElectoralApp/1.0"})
+    response = request_with_retry_sync("GET", url, params=params, headers=NOMINATIM_HEADERS)
     response.raise_for_status()
     results = response.json()
     if not results:
@@ -52,34 +70,6 @@ def geocode_address_osm(address: str):
     lon = float(results[0]["lon"])
     return lat, lon
 
-def update_profiles_latlon_from_csv(engine, filepath="backend/database/profiles.csv"):
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    unresolved_addresses = {}
-    total = 0
-    with open(filepath, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            total+=1
-            address = row["ADRESS"]
-            try :
-                latlon = geocode_address_osm(address)
-            except Exception as e :
-                unresolved_addresses[address] = str(e)
-                continue
-            if not latlon:
-                unresolved_addresses[address] = "Address not found"
-                continue
-
-            profile = session.query(Profile).filter(Profile.uniqueid == f"{row['UNIQUEID']}").first()
-            if profile:
-                profile.latitude, profile.longitude = latlon
-                print(f"Updated: {profile.name} => {latlon}")
-
-    session.commit()
-    print("Geocoding done & DB updated!")
-    return(unresolved_addresses,total)
-
 def compute_straight_dist(start_lat=None, start_lon=None):
     """
     Compute straight-line distance from a starting point to each Profile.
@@ -91,28 +81,25 @@ def compute_straight_dist(start_lat=None, start_lon=None):
 
     db = db_module.SessionLocal()
     print(str(db_module.SessionLocal.kw['bind'].url))
-    profiles = db.query(Profile).all()
-    updated = 0
-
-    for p in profiles:
-        if p.latitude is not None and p.longitude is not None:
-            dist_m = haversine(start_lat, start_lon, p.latitude, p.longitude)
-            p.distance = dist_m
-            updated += 1
+    rows = (
+        db.query(Profile.id, Profile.latitude, Profile.longitude)
+        .filter(Profile.latitude.isnot(None), Profile.longitude.isnot(None))
+        .all()
+    )
+    if rows:
+        ids, lats, lons = zip(*rows)
+        distances = haversine_to_many(start_lat, start_lon, lats, lons)
+        db.bulk_update_mappings(Profile, [
+            {"id": profile_id, "distance": float(dist_m)}
+            for profile_id, dist_m in zip(ids, distances)
+        ])
 
     db.commit()
     db.close()
-    print(f"Updated distance for {updated} profiles.")
+    print(f"Updated distance for {len(rows)} profiles.")
 
-def get_optimized_route(start_lat,start_lon,points,profile_ids,lat_first=True,loop_at_start=False):
-    """
-    Arranges the points in the best order.
-    start = start coordinate
-    points = list of coordinates to visit
-    profile_ids = list of profile uniqueids associated with the points
-    lat_first = coordinates start with latitude ?
-    loop_at_start = should the route loop back at starting position ?
-    """
+def get_ors_headers():
+    "Headers authenticating a request to ORS, reads the API key from the environment."
     try :
         load_dotenv("/etc/secrets/.env")
     except :
@@ -122,12 +109,47 @@ def get_optimized_route(start_lat,start_lon,points,profile_ids,lat_first=True,lo
     if not ORS_API_KEY:
         raise RuntimeError("ORS_API_KEY environment variable is missing.")
 
-    url = "https://api.openrouteservice.org/optimization"
-    headers = {
+    return {
         "Authorization": ORS_API_KEY,
         "Content-Type": "application/json"
     }
 
+def post_ors_cached(url, body, headers, cache=ors_cache):
+    """
+    POSTs a request to ORS, going through the response cache.
+    Identical requests (same url and body) are served from disk without calling ORS.
+    cache = None skips the cache, for callers caching the response their own way
+    """
+    key = cache.make_key(url, body) if cache is not None else None
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return cached
+    response = request_with_retry_sync("POST", url, json=body, headers=headers)
+    response.raise_for_status()
+    data = response.json()
+    if cache is not None:
+        cache.set(key, data)
+    return data
+
+async def post_ors_cached_async(url, body, headers, cache=ors_cache):
+    "Async variant of post_ors_cached, through the shared HTTP client. The SQLite cache is read and written off the event loop."
+    if cache is not None:
+        key = cache.make_key(url, body)
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return cached
+    response = await request_with_retry("POST", url, json=body, headers=headers)
+    response.raise_for_status()
+    data = response.json()
+    if cache is not None:
+        await asyncio.to_thread(cache.set, key, data)
+    return data
+
+def build_optimization_request(start_lat,start_lon,points,profile_ids,lat_first=True,loop_at_start=False,end_coord=None):
+    """
+    Builds the ORS /optimization body of a single vehicle problem.
+    Returns (body, id_map), id_map linking each job index to its profile id.
+    """
     if lat_first : # ORS needs lon,lat
         coordinates = [[lon, lat] for lat, lon in points]
     else :
@@ -145,6 +167,8 @@ def get_optimized_route(start_lat,start_lon,points,profile_ids,lat_first=True,lo
     }
     if loop_at_start:
         vehicle["end"] = start
+    elif end_coord:
+        vehicle["end"] = [end_coord[1], end_coord[0]]
 
     jobs = [] # index, coordinates
     id_map = {} # index, profile uniqueid
@@ -161,51 +185,234 @@ def get_optimized_route(start_lat,start_lon,points,profile_ids,lat_first=True,lo
         "vehicles": [vehicle]
     }
     print("Request body to ORS:", json.dumps(body, indent=2))
-    try :
-        response = requests.post(url, json=body, headers=headers)
-        response.raise_for_status()
-        return (response.json(),id_map)
-    except requests.exceptions.HTTPError as e:
-        print(f"ORS API returned an HTTPError: {e} | {response.text}")
-        return None, None
+    return body, id_map
 
-def get_directions_route(ordered_points):
+@timed("ors_optimization")
+def get_optimized_route(start_lat,start_lon,points,profile_ids,lat_first=True,loop_at_start=False,end_coord=None):
     """
-    Uses real roads/paths to follow.
-    ordered_points: list of (lat, lon) tuples in the optimized order.
+    Arranges the points in the best order.
+    start = start coordinate
+    points = list of coordinates to visit
+    profile_ids = list of profile uniqueids associated with the points
+    lat_first = coordinates start with latitude ?
+    loop_at_start = should the route loop back at starting position ?
+    end_coord = optional (lat, lon) the route must finish at, ignored if loop_at_start
     """
+    headers = get_ors_headers()
+    body, id_map = build_optimization_request(start_lat, start_lon, points, profile_ids, lat_first, loop_at_start, end_coord)
     try :
-        load_dotenv("/etc/secrets/.env")
-    except :
-        print("Warning, couldn't load Render env file.\nIgnore if running on local.")
+        return (post_ors_cached(ORS_OPTIMIZATION_URL, body, headers),id_map)
+    except httpx.HTTPStatusError as e:
+        print(f"ORS API returned an HTTPError: {e} | {e.response.text}")
+        return None, None
 
-    ORS_API_KEY = os.getenv("ORS_API_KEY")
-    if not ORS_API_KEY:
-        raise RuntimeError("ORS_API_KEY environment variable is missing.")
+@timed("ors_optimization")
+async def get_optimized_route_async(start_lat,start_lon,points,profile_ids,lat_first=True,loop_at_start=False,end_coord=None):
+    "Async variant of get_optimized_route, same arguments and (result, id_map) return."
+    headers = await asyncio.to_thread(get_ors_headers) # Reads the .env file
+    body, id_map = build_optimization_request(start_lat, start_lon, points, profile_ids, lat_first, loop_at_start, end_coord)
+    try :
+        return (await post_ors_cached_async(ORS_OPTIMIZATION_URL, body, headers),id_map)
+    except httpx.HTTPStatusError as e:
+        print(f"ORS API returned an HTTPError: {e} | {e.response.text}")
+        return None, None
 
-    url = "https://api.openrouteservice.org/v2/directions/driving-car/geojson"
-    headers = {
-        "Authorization": ORS_API_KEY,
-        "Content-Type": "application/json"
+@timed("local_solver")
+def get_local_optimized_route(start_lat,start_lon,points,profile_ids,lat_first=True,loop_at_start=False,time_budget=LOCAL_SOLVER_TIME_BUDGET,matrix=None,end_coord=None):
+    """
+    Arranges the points in the best order, solved in-process instead of calling ORS.
+    Takes the same arguments as get_optimized_route and returns the same (result, id_map)
+    shape, with result mimicking the ORS /optimization response.
+    time_budget = seconds allowed to improve the tour
+    matrix = optional (N+1)x(N+1) cost matrix, node 0 being the start (e.g. road durations),
+             defaults to straight-line distances. With end_coord it is (N+2)x(N+2), the end being the last node
+    end_coord = optional (lat, lon) the route must finish at, ignored if loop_at_start
+    """
+    if lat_first :
+        latlons = list(points)
+    else :
+        latlons = [(lat, lon) for lon, lat in points]
+
+    if start_lat and start_lon :
+        start = (start_lat, start_lon)
+    else :
+        start = latlons[0]
+
+    nodes = [start] + latlons # node 0 is the start, node i is job i
+    end = None
+    if end_coord and not loop_at_start :
+        end = len(nodes)
+        nodes.append(tuple(end_coord))
+    if matrix is None :
+        matrix = haversine_matrix(nodes)
+    matrix = matrix.tolist() if hasattr(matrix, "tolist") else matrix
+    tour = solve_tour(matrix, start=0, end=end, loop_at_start=loop_at_start, time_budget=time_budget)
+    if end is not None :
+        tour = tour[:-1] # The end isn't a job, added back as an "end" step below
+
+    id_map = {idx: real_id for idx, real_id in enumerate(profile_ids, start=1)}
+    steps = [{"type": "start", "location": [start[1], start[0]]}]
+    cost = 0.0
+    for previous, node in zip(tour, tour[1:]):
+        cost += matrix[previous][node]
+        lat, lon = nodes[node]
+        steps.append({"type": "job", "job": node, "location": [lon, lat]})
+    if loop_at_start :
+        cost += matrix[tour[-1]][0]
+        steps.append({"type": "end", "location": [start[1], start[0]]})
+    elif end is not None :
+        cost += matrix[tour[-1]][end]
+        steps.append({"type": "end", "location": [end_coord[1], end_coord[0]]})
+
+    result = {
+        "code": 0,
+        "summary": {"routes": 1, "cost": round(cost)},
+        "routes": [{
+            "vehicle": 1,
+            "cost": round(cost),
+            "steps": steps
+        }]
     }
+    return (result, id_map)
 
-    coordinates=[]
+def round_point(point):
+    "(lat, lon) rounded to DIRECTIONS_LEG_PRECISION, stops a meter apart share their legs."
+    return (round(point[0], DIRECTIONS_LEG_PRECISION), round(point[1], DIRECTIONS_LEG_PRECISION))
 
-    for lat, lon in ordered_points:
-        if (lon > -70) or (lat < 40):
-            print(f"WARN coordinates seem outside of expected value :\nlon: {lon}, lat: {lat}")
-        coordinates.append([lon, lat]) 
+def leg_key(origin, destination) -> str:
+    "Directions leg cache key of two rounded (lat, lon) points."
+    return f"{origin[0]},{origin[1]};{destination[0]},{destination[1]}"
 
-    print(f"Original points : {ordered_points[:10]}...{ordered_points[-10:]}\nRearranged points : {coordinates}")
+def build_leg_requests(legs):
+    """
+    Batches the legs missing from the cache into ORS directions bodies.
+    Consecutive legs share their waypoint, the gaps between non consecutive legs are
+    listed in skip_segments so ORS doesn't route them. ORS caps the waypoints per request,
+    more legs are spread over several bodies.
+    legs: list of (origin, destination) rounded (lat, lon) pairs.
+    Returns [(body, [(leg, first_waypoint, last_waypoint), ...]), ...]
+    """
+    batches = []
+    coordinates, skip_segments, slots = [], [], []
+    for origin, destination in legs:
+        for lat, lon in (origin, destination):
+            if (lon > -70) or (lat < 40):
+                print(f"WARN coordinates seem outside of expected value :\nlon: {lon}, lat: {lat}")
+        continued = bool(coordinates) and coordinates[-1] == [origin[1], origin[0]]
+        needed = 1 if continued else 2
+        if len(coordinates) + needed > ORS_MAX_WAYPOINTS:
+            batches.append((coordinates, skip_segments, slots))
+            coordinates, skip_segments, slots = [], [], []
+            continued = False
+        if not continued:
+            if coordinates:
+                skip_segments.append(len(coordinates)) # 1-based segment from the last point to this origin
+            coordinates.append([origin[1], origin[0]])
+        coordinates.append([destination[1], destination[0]])
+        slots.append(((origin, destination), len(coordinates) - 2, len(coordinates) - 1))
+    if coordinates:
+        batches.append((coordinates, skip_segments, slots))
+
+    requests_to_send = []
+    for coordinates, skip_segments, slots in batches:
+        body = {"coordinates": coordinates, "instructions": False}
+        if skip_segments:
+            body["skip_segments"] = skip_segments
+        requests_to_send.append((body, slots))
+    return requests_to_send
+
+def split_legs(route_geojson, slots):
+    "Cuts a batched directions response back into {leg_key: [[lon, lat], ...]} with properties.way_points."
+    feature = route_geojson["features"][0]
+    line_coords = feature["geometry"]["coordinates"]
+    way_points = feature["properties"]["way_points"]
+    return {
+        leg_key(*leg): line_coords[way_points[first]:way_points[last] + 1]
+        for leg, first, last in slots
+    }
 
-    body = {
-        "coordinates": coordinates,
-        "instructions": False
+def missing_legs(ordered_points):
+    "(legs, cached) : the rounded legs of the route and the {leg_key: coordinates} already in the cache."
+    points = [round_point(point) for point in ordered_points]
+    legs = [(origin, destination) for origin, destination in zip(points, points[1:]) if origin != destination]
+    cached = directions_leg_cache.get_many(leg_key(*leg) for leg in legs)
+    missing = list({leg_key(*leg): leg for leg in legs if leg_key(*leg) not in cached}.values())
+    return legs, cached, missing
+
+def assemble_legs(legs, leg_coords):
+    """
+    Concatenates the legs geometries into a directions GeoJSON shaped like the ORS one.
+    Returns a FeatureCollection with a single LineString feature, its way_points and summary distance.
+    """
+    line_coords = []
+    way_points = [0]
+    for leg in legs:
+        coords = leg_coords[leg_key(*leg)]
+        line_coords.extend(coords[1:] if line_coords else coords)
+        way_points.append(max(len(line_coords) - 1, 0))
+    if not line_coords and legs:
+        line_coords = [[legs[0][0][1], legs[0][0][0]]]
+
+    distance = path_length([(lat, lon) for lon, lat in line_coords])
+    return {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": line_coords},
+            "properties": {"summary": {"distance": round(distance, 1)}, "way_points": way_points},
+        }],
     }
 
-    response = requests.post(url, json=body, headers=headers)
-    response.raise_for_status()
-    return response.json()
+@timed("directions")
+def get_directions_route(ordered_points):
+    """
+    Uses real roads/paths to follow.
+    ordered_points: list of (lat, lon) tuples in the optimized order.
+    Answered by the offline road graph when ROAD_GRAPH_FILE is set, by ORS otherwise
+    or when a point can't be routed locally.
+    ORS geometry is cached per leg (pair of consecutive stops), only the legs missing
+    from the cache are requested, so a route that changed by a few stops costs a few legs.
+    """
+    graph = get_road_graph()
+    if graph is not None:
+        try:
+            return graph.directions(ordered_points)
+        except ValueError as e:
+            print(f"WARN Local road graph couldn't route ({e}), asking ORS")
+
+    legs, leg_coords, missing = missing_legs(ordered_points)
+    if missing:
+        headers = get_ors_headers()
+        fetched = {}
+        for body, slots in build_leg_requests(missing):
+            fetched.update(split_legs(post_ors_cached(ORS_DIRECTIONS_URL, body, headers, cache=None), slots))
+        directions_leg_cache.set_many(fetched)
+        leg_coords.update(fetched)
+    return assemble_legs(legs, leg_coords)
+
+@timed("directions")
+async def get_directions_route_async(ordered_points):
+    "Async variant of get_directions_route, the batches of missing legs are requested concurrently."
+    graph = await asyncio.to_thread(get_road_graph) # The first call loads the graph
+    if graph is not None:
+        try:
+            return await asyncio.to_thread(graph.directions, ordered_points)
+        except ValueError as e:
+            print(f"WARN Local road graph couldn't route ({e}), asking ORS")
+
+    legs, leg_coords, missing = await asyncio.to_thread(missing_legs, ordered_points)
+    if missing:
+        headers = await asyncio.to_thread(get_ors_headers)
+        batches = build_leg_requests(missing)
+        responses = await asyncio.gather(*[
+            post_ors_cached_async(ORS_DIRECTIONS_URL, body, headers, cache=None) for body, _ in batches
+        ])
+        fetched = {}
+        for (_, slots), route_geojson in zip(batches, responses):
+            fetched.update(split_legs(route_geojson, slots))
+        await asyncio.to_thread(directions_leg_cache.set_many, fetched)
+        leg_coords.update(fetched)
+    return assemble_legs(legs, leg_coords)
 
 def get_gradient_colors(n):
     """
@@ -223,18 +430,46 @@ def get_gradient_colors(n):
         gradient.append(steps[idx])
     return gradient
 
-def display_route_on_map(result, id_map, profiles, start_coord=None):
+def display_route_on_map(result, id_map, profiles, start_coord=None, rows=None):
     """
     Calls get_directions_route.
     result: JSON returned by get_optimized_route()
     id_map: {job_id: profile_uniqueid}
     profiles: dict of {profile_uniqueid: (lat, lon)}
     start_coord: tuple (lat, lon) of starting point
+    rows: optional {profile_uniqueid: marker row}, spares the profiles query
     """
 
+    ordered_points, ordered_ids = ordered_route_stops(result, id_map, profiles, start_coord)
+    if not ordered_points:
+        return
+
+    # Get real route
+    route_geojson = get_directions_route(ordered_points)
+    line_coords = route_geojson["features"][0]["geometry"]["coordinates"]  # [ [lon, lat], ... ]
+    return build_route_display(ordered_points, ordered_ids, line_coords, start_coord, rows)
+
+async def display_route_on_map_async(result, id_map, profiles, start_coord=None, rows=None):
+    "Async variant of display_route_on_map, the profile lookup (without rows) runs in a worker thread."
+    ordered_points, ordered_ids = ordered_route_stops(result, id_map, profiles, start_coord)
+    if not ordered_points:
+        return
+
+    route_geojson = await get_directions_route_async(ordered_points)
+    line_coords = route_geojson["features"][0]["geometry"]["coordinates"]  # [ [lon, lat], ... ]
+    if rows is not None:
+        return build_route_display(ordered_points, ordered_ids, line_coords, start_coord, rows)
+    return await asyncio.to_thread(build_route_display, ordered_points, ordered_ids, line_coords, start_coord)
+
+def ordered_route_stops(result, id_map, profiles, start_coord=None):
+    """
+    Reads the visiting order out of an optimization result.
+    Returns (ordered_points, ordered_ids), ordered_points starting with start_coord if given.
+    Both are empty if there is nothing to display.
+    """
     if result is None or id_map is None:
         print("No route result to display. Check your ORS request.")
-        return
+        return [], []
 
     # Extract ordered job IDs
     steps = result["routes"][0]["steps"]
@@ -249,56 +484,37 @@ def display_route_on_map(result, id_map, profiles, start_coord=None):
 
     if not ordered_points:
         print("No route steps found.")
-        return
+        return [], []
 
     if start_coord:
         ordered_points = [start_coord] + ordered_points
+    return ordered_points, ordered_ids
 
-    # Get real route
-    route_geojson = get_directions_route(ordered_points)
-    line_coords = route_geojson["features"][0]["geometry"]["coordinates"]  # [ [lon, lat], ... ]
-
-    # Load names
-    db = db_module.SessionLocal()
-    print(str(db_module.SessionLocal.kw['bind'].url))
-    profile_names = {}
-    profile_arguments = {}
-    profile_age = {}
-    profile_nbhood = {}
-    profile_preferred_language = {}
-    profile_origin = {}
-    profile_political_scale = {}
-    profile_ideal_process = {}
-    profile_strategic_profile = {}
-    profile_personality = {}
-    profiles_db = db.query(Profile).filter(Profile.id.in_(ordered_ids)).all()
-    for p in profiles_db:
-        profile_names[p.id] = p.name
-        profile_arguments[p.id] = p.suggested_arguments
-        profile_age[p.id] = p.age
-        profile_nbhood[p.id] = p.nbhood
-        profile_preferred_language[p.id] = p.preferred_language
-        profile_origin[p.id] = p.origin
-        profile_political_scale[p.id] = p.political_scale
-        profile_ideal_process[p.id] = p.ideal_process
-        profile_strategic_profile[p.id] = p.strategic_profile
-        profile_personality[p.id] = p.personality
-    db.close()
+@timed("route_display")
+def build_route_display(ordered_points, ordered_ids, line_coords, start_coord=None, rows=None):
+    """
+    Builds the map response of an ordered route.
+    rows = optional {profile id: marker row} (see backend.database.projections) the caller already loaded,
+    the profiles details are only queried when missing.
+    """
+    if rows is None:
+        rows = load_marker_rows(ordered_ids)
 
     markers = []
     for (lat, lon), profile_id in zip(ordered_points[1:], ordered_ids):
+        row = rows.get(profile_id)
         markers.append({
             "id": profile_id,
-            "name": profile_names.get(profile_id, "Unknown"),
-            "arguments": profile_arguments.get(profile_id, "None"),
-            "age": profile_age.get(profile_id, "None"),
-            "nbhood": profile_nbhood.get(profile_id, "None"),
-            "preferred_language": profile_preferred_language.get(profile_id, "None"),
-            "origin": profile_origin.get(profile_id, "None"),
-            "political_scale": profile_political_scale.get(profile_id, "None"),
-            "ideal_process": profile_ideal_process.get(profile_id, "None"),
-            "strategic_profile": profile_strategic_profile.get(profile_id, "None"),
-            "personality": profile_personality.get(profile_id, "None"),
+            "name": row.name if row else "Unknown",
+            "arguments": row.suggested_arguments if row else "None",
+            "age": row.age if row else "None",
+            "nbhood": row.nbhood if row else "None",
+            "preferred_language": row.preferred_language if row else "None",
+            "origin": row.origin if row else "None",
+            "political_scale": row.political_scale if row else "None",
+            "ideal_process": row.ideal_process if row else "None",
+            "strategic_profile": row.strategic_profile if row else "None",
+            "personality": row.personality if row else "None",
             "lat": lat,
             "lon": lon
         })
@@ -0,0 +1,147 @@
+# Batch geocoding of the profiles addresses, backed by a persistent geocode cache
+
+import csv
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from backend.database.models import Profile, GeocodeCache
+from backend.utils.constants import CSV_PATH, NOMINATIM_MIN_INTERVAL, GEOCODE_COMMIT_EVERY
+from backend.utils.geo import geocode_address_osm
+
+SQL_IN_CHUNK = 500 # Keeps IN (...) lists under SQLite's bound parameters limit
+
+def normalize_address(address: str) -> str:
+    "Cache key of an address : case and whitespace differences don't matter."
+    return " ".join(str(address).replace(",", " , ").split()).casefold()
+
+class RateLimiter:
+    "Spaces calls by at least min_interval seconds, shared between threads."
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_call:
+                time.sleep(self._next_call - now)
+                now = self._next_call
+            self._next_call = now + self.min_interval
+
+def read_addresses_from_csv(filepath: str = CSV_PATH):
+    """
+    Groups the CSV rows by normalized address.
+    Returns ({normalized_address: (raw_address, [uniqueids])}, total_rows).
+    """
+    addresses = {}
+    total = 0
+    with open(filepath, newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            total += 1
+            raw_address = row["ADRESS"]
+            if not raw_address or not raw_address.strip():
+                continue
+            key = normalize_address(raw_address)
+            addresses.setdefault(key, (raw_address, []))[1].append(row["UNIQUEID"])
+    return addresses, total
+
+def load_cached_geocodes(session, keys):
+    "Returns {normalized_address: (lat, lon) or None} for the keys already in the cache."
+    keys = list(keys)
+    cached = {}
+    for i in range(0, len(keys), SQL_IN_CHUNK):
+        rows = session.execute(
+            select(GeocodeCache.address, GeocodeCache.latitude, GeocodeCache.longitude)
+            .where(GeocodeCache.address.in_(keys[i:i + SQL_IN_CHUNK]))
+        ).all()
+        for address, lat, lon in rows:
+            cached[address] = (lat, lon) if lat is not None and lon is not None else None
+    return cached
+
+def geocode_missing(session, missing, geocoder=geocode_address_osm, min_interval=NOMINATIM_MIN_INTERVAL,
+                    commit_every=GEOCODE_COMMIT_EVERY):
+    """
+    Geocodes the cache misses one at a time, honouring Nominatim's rate limit.
+    Results (including "not found") are written to the cache and committed every
+    commit_every addresses, so an interrupted run resumes where it stopped.
+
+    missing = {normalized_address: raw_address}
+    Returns (resolved, errors) : {key: (lat, lon) or None} and {raw_address: error message}.
+    """
+    limiter = RateLimiter(min_interval)
+    resolved = {}
+    errors = {}
+    for done, (key, raw_address) in enumerate(missing.items(), start=1):
+        limiter.wait()
+        try:
+            latlon = geocoder(raw_address)
+        except Exception as e:
+            errors[raw_address] = str(e) # Transient, not cached
+            continue
+        resolved[key] = latlon
+        session.merge(GeocodeCache(
+            address=key,
+            latitude=latlon[0] if latlon else None,
+            longitude=latlon[1] if latlon else None,
+            updated_at=datetime.utcnow()
+        ))
+        if done % commit_every == 0:
+            session.commit()
+            print(f"Geocoded {done}/{len(missing)} new addresses")
+    session.commit()
+    return resolved, errors
+
+def write_profile_coordinates(session, coordinates_by_uniqueid):
+    "Bulk updates the profiles coordinates from {uniqueid: (lat, lon)}."
+    ids_by_uniqueid = dict(session.execute(select(Profile.uniqueid, Profile.id)).all())
+    mappings = [
+        {"id": ids_by_uniqueid[uniqueid], "latitude": lat, "longitude": lon}
+        for uniqueid, (lat, lon) in coordinates_by_uniqueid.items()
+        if uniqueid in ids_by_uniqueid
+    ]
+    session.bulk_update_mappings(Profile, mappings)
+    session.commit()
+    return len(mappings)
+
+def update_profiles_latlon_from_csv(engine, filepath=CSV_PATH):
+    """
+    Fills the profiles latitude/longitude from the CSV addresses.
+    1. Deduplicates normalized addresses (households share one address).
+    2. Reads the known ones from the geocode cache.
+    3. Geocodes only the misses, at most one Nominatim call per NOMINATIM_MIN_INTERVAL.
+    4. Writes the coordinates back in bulk.
+    Returns (unresolved_addresses, total) : {address: reason} and the number of CSV rows.
+    """
+    GeocodeCache.__table__.create(engine, checkfirst=True)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    try:
+        addresses, total = read_addresses_from_csv(filepath)
+        cached = load_cached_geocodes(session, addresses.keys())
+        missing = {key: raw for key, (raw, _) in addresses.items() if key not in cached}
+        print(f"{len(addresses)} distinct addresses for {total} rows, {len(cached)} cached, {len(missing)} to geocode")
+
+        resolved, unresolved_addresses = geocode_missing(session, missing)
+        cached.update(resolved)
+
+        coordinates = {}
+        for key, (raw_address, uniqueids) in addresses.items():
+            if key not in cached:
+                continue # Failed this run, reason already in unresolved_addresses
+            if cached[key] is None:
+                unresolved_addresses[raw_address] = "Address not found"
+                continue
+            for uniqueid in uniqueids:
+                coordinates[uniqueid] = cached[key]
+
+        updated = write_profile_coordinates(session, coordinates)
+        print(f"Geocoding done & DB updated! ({updated} profiles)")
+    finally:
+        session.close()
+    return(unresolved_addresses,total)
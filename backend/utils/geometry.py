@@ -0,0 +1,77 @@
+# Vectorized spatial math on (lat, lon) arrays, distances are in meters
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+def as_latlon_array(points):
+    "Converts a list of (lat, lon) tuples to a (N, 2) float array."
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+def project_to_meters(points):
+    """
+    Equirectangular projection around the points mean latitude, accurate at city scale.
+    points = (N, 2) array or list of (lat, lon)
+    Returns an (N, 2) array of (x, y) in meters, x pointing east and y north.
+    """
+    coords = np.radians(as_latlon_array(points))
+    if not len(coords):
+        return coords
+    lon_scale = np.cos(coords[:, 0].mean())
+    return np.column_stack((coords[:, 1] * lon_scale, coords[:, 0])) * EARTH_RADIUS_M
+
+def haversine_to_many(lat, lon, lats, lons):
+    """
+    Great-circle distance from one point to many.
+    lat, lon = origin coordinate
+    lats, lons = arrays of destination coordinates
+    Returns an array of distances in meters.
+    """
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def path_length(points):
+    """
+    Length in meters of a polyline.
+    points = (N, 2) array or list of (lat, lon)
+    """
+    coords = np.radians(as_latlon_array(points))
+    if len(coords) < 2:
+        return 0.0
+    lat1, lat2 = coords[:-1, 0], coords[1:, 0]
+    dlat = lat2 - lat1
+    dlon = coords[1:, 1] - coords[:-1, 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return float(np.sum(2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))))
+
+def haversine_matrix(points, other_points=None):
+    """
+    Great-circle distances between every pair of points.
+    points = (N, 2) array or list of (lat, lon)
+    other_points = (M, 2) array or list of (lat, lon), defaults to points
+    Returns an (N, M) array of distances in meters.
+    """
+    origins = np.radians(as_latlon_array(points))
+    targets = origins if other_points is None else np.radians(as_latlon_array(other_points))
+    lat1 = origins[:, 0][:, None]
+    lat2 = targets[:, 0][None, :]
+    dlat = lat2 - lat1
+    dlon = targets[:, 1][None, :] - origins[:, 1][:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def centroids(points, clusters):
+    """
+    Mean coordinate of each cluster.
+    points = (N, 2) array or list of (lat, lon)
+    clusters = list of clusters, each a list of point indexes
+    Returns a (len(clusters), 2) array of (lat, lon).
+    """
+    coords = as_latlon_array(points)
+    if not clusters:
+        return np.empty((0, 2))
+    return np.vstack([coords[cluster].mean(axis=0) for cluster in clusters])
@@ -0,0 +1,139 @@
+# Shared HTTP clients for outbound geo calls (ORS, Nominatim), async for the routes and sync for worker threads
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from backend.utils.constants import (HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_MAX_CONNECTIONS,
+                                     HTTP_MAX_KEEPALIVE, HTTP_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX,
+                                     HTTP_RETRY_AFTER_MAX)
+from backend.utils.metrics import record_outbound, outbound_endpoint
+from backend.utils.ors_scheduler import ors_scheduler
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+_client = None
+_sync_client = None
+
+def _http2_available() -> bool:
+    try:
+        import h2 # noqa: F401 - only needed by httpx when http2=True
+        return True
+    except ImportError:
+        return False
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    App-lifetime client : connections are kept alive and reused between requests.
+    Created on first use, closed by close_async_client on shutdown.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_http2_available(),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        )
+    return _client
+
+async def close_async_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_sync_client() -> httpx.Client:
+    "Blocking counterpart of get_async_client, for the calls made from worker threads and the CLI."
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        _sync_client = httpx.Client(
+            http2=_http2_available(),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        )
+    return _sync_client
+
+def close_sync_client():
+    global _sync_client
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+_sync_client = None
+
+def backoff_delay(attempt: int) -> float:
+    "Exponential backoff with full jitter, so concurrent retries don't hit the API in sync."
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+def retry_after_delay(response: httpx.Response):
+    "Seconds asked by a Retry-After header (delay or HTTP date), None without one. Capped at HTTP_RETRY_AFTER_MAX."
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), HTTP_RETRY_AFTER_MAX)
+
+async def request_with_retry(method: str, url: str, retries: int = HTTP_RETRIES, **kwargs) -> httpx.Response:
+    """
+    Sends a request through the shared client, retrying transport errors and
+    429/5xx gateway answers with jittered backoff.
+    Each attempt first waits for a slot of the ORS scheduler, a Retry-After answer
+    holds the whole endpoint that long.
+    Returns the last response, callers still call raise_for_status().
+    Raises OrsQuotaExceeded when the endpoint's daily budget is spent.
+    """
+    client = get_async_client()
+    endpoint = outbound_endpoint(url)
+    for attempt in range(retries + 1):
+        await ors_scheduler.acquire(endpoint)
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            record_outbound(url, "error")
+            if attempt == retries:
+                raise
+            print(f"WARN {method} {url} failed ({e!r}), retrying")
+        else:
+            record_outbound(url, response.status_code)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                return response
+            print(f"WARN {method} {url} returned {response.status_code}, retrying")
+            retry_after = retry_after_delay(response)
+            if retry_after is not None:
+                # The next acquire waits it out, along with every other call to this endpoint
+                ors_scheduler.pause(endpoint, max(retry_after, backoff_delay(attempt)))
+                continue
+        await asyncio.sleep(backoff_delay(attempt))
+
+def request_with_retry_sync(method: str, url: str, retries: int = HTTP_RETRIES, **kwargs) -> httpx.Response:
+    "Blocking variant of request_with_retry, same retries, scheduler slots and Retry-After handling."
+    client = get_sync_client()
+    endpoint = outbound_endpoint(url)
+    for attempt in range(retries + 1):
+        ors_scheduler.acquire_sync(endpoint)
+        try:
+            response = client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            record_outbound(url, "error")
+            if attempt == retries:
+                raise
+            print(f"WARN {method} {url} failed ({e!r}), retrying")
+        else:
+            record_outbound(url, response.status_code)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                return response
+            print(f"WARN {method} {url} returned {response.status_code}, retrying")
+            retry_after = retry_after_delay(response)
+            if retry_after is not None:
+                # The next acquire waits it out, along with every other call to this endpoint
+                ors_scheduler.pause(endpoint, max(retry_after, backoff_delay(attempt)))
+                continue
+        time.sleep(backoff_delay(attempt))
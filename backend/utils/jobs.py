@@ -0,0 +1,107 @@
+# In-process queue of long route computations, polled by job id
+
+import asyncio
+import contextvars
+import time
+import uuid
+
+from backend.utils.constants import JOB_WORKERS, JOB_RESULT_TTL, JOB_MAX_PENDING
+
+class Job:
+    "A queued computation, its progress and once finished its result or error."
+
+    def __init__(self, run):
+        self.id = uuid.uuid4().hex
+        self.run = run # async callable taking the job, returns the result
+        self.status = "queued" # queued -> running -> done | failed
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def add_work(self, units: int = 1):
+        "Announces units of work (e.g. clusters) still to come."
+        self.total += units
+
+    def work_done(self, units: int = 1):
+        self.done += units
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "error": self.error,
+        }
+
+class JobQueue:
+    """
+    Bounded pool of asyncio workers consuming submitted jobs.
+    Finished jobs are kept ttl seconds for their result to be fetched, then forgotten.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, ttl: float = JOB_RESULT_TTL, max_pending: int = JOB_MAX_PENDING):
+        self.workers = workers
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._queue = None
+        self._tasks = []
+        self._jobs = {}
+
+    def _ensure_started(self):
+        # Created lazily, the queue must belong to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            # Each worker gets an empty context : created from the first submit, they would otherwise
+            # keep that request's context (its Server-Timing stage list) for the life of the process
+            self._tasks = [asyncio.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)]
+
+    def submit(self, run) -> Job:
+        """
+        Queues run(job) and returns the job right away.
+        Raises asyncio.QueueFull when max_pending jobs are already waiting.
+        """
+        self.purge()
+        self._ensure_started()
+        job = Job(run)
+        self._queue.put_nowait(job)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str):
+        "The job, or None if unknown or expired."
+        self.purge()
+        return self._jobs.get(job_id)
+
+    def purge(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            try:
+                job.result = await job.run(job)
+                job.status = "done"
+            except Exception as e:
+                print(f"WARN Job {job.id} failed: {e!r}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue = None
+        self._tasks = []
+
+job_queue = JobQueue()
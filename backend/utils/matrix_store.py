@@ -0,0 +1,220 @@
+# Road distance/duration matrices : from the offline road graph, or fetched from ORS /matrix in tiles
+# and stored as memory-mapped .npy files
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from backend.utils.constants import (CACHE_PATH, MATRIX_STORE_DIR, MATRIX_STORE_MAX_BYTES, MATRIX_STORE_PRECISION,
+                                     ORS_MATRIX_TILE_SIZE, UNREACHABLE_COST)
+from backend.utils.geo import get_ors_headers, post_ors_cached_async, ORS_BASE_URL
+from backend.utils.road_graph import get_road_graph
+
+ORS_MATRIX_URL = f"{ORS_BASE_URL}/v2/matrix/driving-car"
+
+def _to_array(rows):
+    "ORS answers null for unreachable pairs, they get a large finite cost so solvers can still compare."
+    return np.array([[UNREACHABLE_COST if v is None else v for v in row] for row in rows], dtype=np.float32)
+
+async def fetch_matrix_tiled(sources, destinations=None, tile_size=ORS_MATRIX_TILE_SIZE):
+    """
+    Fetches the road distance and duration matrix between two sets of points.
+    Each ORS request covers at most tile_size sources x tile_size destinations,
+    the tiles are requested concurrently through the shared HTTP client and stitched back into full matrices.
+
+    sources = list of (lat, lon)
+    destinations = list of (lat, lon), defaults to sources
+    tile_size = number of sources (and destinations) per sub-request
+
+    Returns (distances, durations), two (len(sources), len(destinations)) float32 arrays
+    in meters and seconds.
+    """
+    if destinations is None:
+        destinations = sources
+    headers = await asyncio.to_thread(get_ors_headers)
+    distances = np.empty((len(sources), len(destinations)), dtype=np.float32)
+    durations = np.empty((len(sources), len(destinations)), dtype=np.float32)
+
+    async def fetch_tile(i, j):
+        tile_sources = sources[i:i + tile_size]
+        tile_destinations = destinations[j:j + tile_size]
+        locations = [[lon, lat] for lat, lon in tile_sources + tile_destinations]
+        body = {
+            "locations": locations,
+            "sources": list(range(len(tile_sources))),
+            "destinations": list(range(len(tile_sources), len(locations))),
+            "metrics": ["distance", "duration"],
+            "units": "m"
+        }
+        tile = await post_ors_cached_async(ORS_MATRIX_URL, body, headers)
+        distances[i:i + len(tile_sources), j:j + len(tile_destinations)] = _to_array(tile["distances"])
+        durations[i:i + len(tile_sources), j:j + len(tile_destinations)] = _to_array(tile["durations"])
+
+    await asyncio.gather(*[
+        fetch_tile(i, j) for i in range(0, len(sources), tile_size) for j in range(0, len(destinations), tile_size)
+    ])
+    return distances, durations
+
+class MatrixStore:
+    """
+    Directory of road matrices, one per set of profiles and coordinates.
+    Each entry is a <key>.npy array of shape (2, N, N) (distances, durations) and a
+    <key>.json listing its profile ids and their coordinates, rows and columns follow that order.
+    Arrays are opened memory-mapped so only the requested rows are read from disk.
+    The least recently used entries are deleted once the arrays exceed max_bytes.
+    """
+
+    def __init__(self, directory=os.path.join(CACHE_PATH, MATRIX_STORE_DIR), max_bytes=MATRIX_STORE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = None # key -> {"positions": {profile_id: position}, "points": {profile_id: (lat, lon)}, "size", "used"}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _round(point):
+        return tuple(round(float(c), MATRIX_STORE_PRECISION) for c in point)
+
+    @classmethod
+    def make_key(cls, profile_ids, points) -> str:
+        "Hash of the profile ids and their coordinates, a moved profile gets a new matrix."
+        pairs = sorted((profile_id, cls._round(point)) for profile_id, point in zip(profile_ids, points))
+        joined = ";".join(f"{profile_id}:{lat},{lon}" for profile_id, (lat, lon) in pairs)
+        return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        return os.path.join(self.directory, f"{key}.npy"), os.path.join(self.directory, f"{key}.json")
+
+    def _entry(self, key, profile_ids, points, used):
+        npy_path, _ = self._paths(key)
+        return {
+            "positions": {profile_id: pos for pos, profile_id in enumerate(profile_ids)},
+            "points": {profile_id: self._round(point) for profile_id, point in zip(profile_ids, points)},
+            "size": os.path.getsize(npy_path),
+            "used": used,
+        }
+
+    def _load_index(self):
+        if self._index is None:
+            self._index = {}
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    if not name.endswith(".json"):
+                        continue
+                    key = name[:-5]
+                    npy_path, json_path = self._paths(key)
+                    try:
+                        with open(json_path, encoding="utf-8") as f:
+                            stored = json.load(f)
+                        # Entries from before the coordinates were stored can't be checked, they are dropped
+                        self._index[key] = self._entry(key, stored["profile_ids"], stored["points"], os.path.getmtime(json_path))
+                    except (OSError, KeyError, ValueError):
+                        self._delete(key)
+        return self._index
+
+    def _delete(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        "Deletes the least recently used entries until the arrays fit in max_bytes."
+        index = self._load_index()
+        total = sum(entry["size"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["used"]):
+            if total <= self.max_bytes or len(index) == 1:
+                break
+            total -= index.pop(key)["size"]
+            self._delete(key)
+
+    def lookup(self, profile_ids, points):
+        """
+        Slices a stored matrix covering all the profile ids at the same coordinates, rows and columns in the given order.
+        Returns (distances, durations) or None if no stored matrix covers them.
+        """
+        wanted = {profile_id: self._round(point) for profile_id, point in zip(profile_ids, points)}
+        with self._lock:
+            index = self._load_index()
+            # Smallest covering matrix first, less to page in
+            for key, entry in sorted(index.items(), key=lambda item: len(item[1]["positions"])):
+                if all(entry["points"].get(profile_id) == point for profile_id, point in wanted.items()):
+                    break
+            else:
+                return None
+            entry["used"] = time.time()
+            npy_path, json_path = self._paths(key)
+            try:
+                os.utime(json_path) # Keeps the recency across restarts
+                stored = np.load(npy_path, mmap_mode="r")
+            except OSError:
+                return None
+        order = [entry["positions"][profile_id] for profile_id in profile_ids]
+        rows = np.ix_(order, order)
+        return np.array(stored[0][rows]), np.array(stored[1][rows])
+
+    def save(self, profile_ids, points, distances, durations):
+        "Persists a matrix whose rows and columns follow profile_ids, located at points."
+        profile_ids, points = list(profile_ids), [list(point) for point in points]
+        key = self.make_key(profile_ids, points)
+        npy_path, json_path = self._paths(key)
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(npy_path, np.stack([distances, durations]).astype(np.float32))
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"profile_ids": profile_ids, "points": points}, f)
+        with self._lock:
+            self._load_index()[key] = self._entry(key, profile_ids, points, time.time())
+            self._evict()
+
+matrix_store = MatrixStore()
+
+def local_road_matrix(graph, points):
+    """
+    Road matrix between points computed on the offline road graph.
+    Raises ValueError if a point is too far from the graph's roads.
+    """
+    nodes = graph.nearest_nodes(points)
+    matrices = graph.many_to_many(nodes, nodes)
+    return tuple(np.where(np.isinf(matrix), UNREACHABLE_COST, matrix).astype(np.float32) for matrix in matrices)
+
+async def get_road_matrix(profile_ids, points, start=None):
+    """
+    Road matrix between profiles. Computed on the offline road graph when ROAD_GRAPH_FILE is set,
+    otherwise sliced from the store when possible and fetched from ORS if not.
+    profile_ids = list of profile ids
+    points = list of (lat, lon) matching profile_ids
+    start = optional (lat, lon), becomes node 0 and shifts the profiles to 1..N
+
+    Returns (distances, durations) as float32 arrays.
+    """
+    points = list(points)
+    graph = await asyncio.to_thread(get_road_graph)
+    if graph is not None:
+        try:
+            return await asyncio.to_thread(local_road_matrix, graph, ([start] if start is not None else []) + points)
+        except ValueError as e:
+            print(f"WARN Local road graph couldn't compute the matrix ({e}), asking ORS")
+
+    matrices = await asyncio.to_thread(matrix_store.lookup, profile_ids, points)
+    if matrices is None:
+        matrices = await fetch_matrix_tiled(points)
+        await asyncio.to_thread(matrix_store.save, profile_ids, points, *matrices)
+    if start is None:
+        return matrices
+
+    # The start isn't a profile, its row and column are fetched for this request only
+    from_start, to_start = await asyncio.gather(fetch_matrix_tiled([start], points), fetch_matrix_tiled(points, [start]))
+    full = []
+    for matrix, row, column in zip(matrices, from_start, to_start):
+        n = len(profile_ids)
+        stitched = np.zeros((n + 1, n + 1), dtype=np.float32)
+        stitched[0, 1:] = row[0]
+        stitched[1:, 0] = column[:, 0]
+        stitched[1:, 1:] = matrix
+        full.append(stitched)
+    return tuple(full)
@@ -0,0 +1,214 @@
+# Hot-path timings and counters, served as Prometheus text on /metrics and per request as Server-Timing headers
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from urllib.parse import urlsplit
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from backend.utils.constants import METRICS_BUCKETS
+
+# Stages timed during the current request, read back by the Server-Timing middleware
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+class Counter:
+    "Prometheus counter, one value per set of labels."
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    "Prometheus histogram with cumulative buckets, one series per set of labels."
+
+    def __init__(self, name, description, labelnames=(), buckets=METRICS_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {} # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labelnames + ("le",), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+stage_seconds = Histogram("mapper_stage_duration_seconds", "Duration of the route computation stages.", ("stage",))
+request_seconds = Histogram("mapper_http_request_duration_seconds", "Duration of the API requests, until the response headers.",
+                            ("method", "route", "status"))
+outbound_requests = Counter("mapper_outbound_requests_total", "Calls to ORS and Nominatim, retries included.",
+                            ("endpoint", "status"))
+
+def record_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((stage, seconds))
+
+class timed:
+    """
+    Times a stage of the request, as a context manager (with timed("db_query"): ...)
+    or as a decorator of a sync or async function (@timed("directions")).
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.stage, time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, func):
+        # A new instance per call, the decorated function can run concurrently
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed(self.stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+def outbound_endpoint(url) -> str:
+    "Label of an outbound call : optimization, directions, matrix, search or other."
+    path = urlsplit(str(url)).path
+    for endpoint in ("optimization", "directions", "matrix", "search"):
+        if endpoint in path:
+            return endpoint
+    return "other"
+
+def record_outbound(url, status):
+    "Counts an ORS/Nominatim call, status is the HTTP status code or \"error\" when no answer came."
+    outbound_requests.inc(endpoint=outbound_endpoint(url), status=status)
+
+def server_timing(stages, total):
+    "Server-Timing header value, the durations of a stage run several times are added up."
+    durations = {}
+    for stage, seconds in stages:
+        durations[stage] = durations.get(stage, 0) + seconds
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every request and adding its stages as a Server-Timing header.
+    Streamed responses send their headers first, their header only covers the stages done by then.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        stages = []
+        token = _request_stages.set(stages)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - start
+                route = scope.get("route")
+                request_seconds.observe(total, method=scope["method"],
+                                        route=getattr(route, "path", "unmatched"), status=message["status"])
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(stages, total).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
+
+def cache_lines():
+    "Hit/miss counters, hit ratio and size of the ORS response and directions leg caches."
+    from backend.utils.ors_cache import ors_cache, directions_leg_cache
+
+    stats = {"ors": ors_cache.stats(), "directions_legs": directions_leg_cache.stats()}
+    lines = []
+    for metric, kind, field, description in (
+        ("mapper_cache_hits_total", "counter", "hits", "Cache lookups answered from the cache."),
+        ("mapper_cache_misses_total", "counter", "misses", "Cache lookups that had to call ORS."),
+        ("mapper_cache_hit_ratio", "gauge", "hit_ratio", "Hits over lookups since startup."),
+        ("mapper_cache_entries", "gauge", "size", "Entries currently stored."),
+    ):
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{cache="{cache}"}} {cache_stats[field]}' for cache, cache_stats in stats.items()]
+    return lines
+
+def budget_lines():
+    "Remaining daily ORS budget and calls waiting for a slot, per endpoint."
+    from backend.utils.ors_scheduler import ors_scheduler
+
+    budget = ors_scheduler.budget()
+    lines = ["# HELP mapper_ors_budget_remaining Calls left in today's ORS budget.",
+             "# TYPE mapper_ors_budget_remaining gauge"]
+    lines += [f'mapper_ors_budget_remaining{{endpoint="{endpoint}"}} {quota["remaining_today"]}'
+              for endpoint, quota in budget.items() if quota["remaining_today"] is not None]
+    lines += ["# HELP mapper_ors_waiting_calls Outbound calls waiting for a rate limit slot.",
+              "# TYPE mapper_ors_waiting_calls gauge"]
+    lines += [f'mapper_ors_waiting_calls{{endpoint="{endpoint}"}} {quota["waiting"]}' for endpoint, quota in budget.items()]
+    return lines
+
+def render_metrics() -> str:
+    lines = (stage_seconds.render() + request_seconds.render() + outbound_requests.render()
+             + cache_lines() + budget_lines())
+    return "\n".join(lines) + "\n"
+
+def metrics_route(app: FastAPI):
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,178 @@
+# Disk-backed cache of ORS responses, keyed by a hash of the request
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from backend.utils.constants import CACHE_PATH, ORS_CACHE_FILE, ORS_CACHE_TTL, ORS_CACHE_MAX_ENTRIES, DIRECTIONS_LEG_CACHE_MAX_ENTRIES
+
+SQL_IN_CHUNK = 500 # Keeps IN (...) lists under SQLite's bound parameters limit
+
+class ResponseCache:
+    """
+    SQLite table of JSON responses with LRU eviction and a TTL.
+    path = SQLite file holding the cache
+    ttl = seconds before an entry expires (None to keep entries forever)
+    max_entries = entries kept before evicting the least recently used ones
+    table = table name, allows several caches in the same file
+    """
+
+    def __init__(self, path=os.path.join(CACHE_PATH, ORS_CACHE_FILE), ttl=ORS_CACHE_TTL,
+                 max_entries=ORS_CACHE_MAX_ENTRIES, table="ors_responses"):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url: str, body: dict) -> str:
+        "Canonical hash of a request : same endpoint and same body (whatever the key order) give the same key."
+        canonical = json.dumps(body, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{url}\n{canonical}".encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        # Opened on first use so importing the module doesn't touch the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_used ON {self.table} (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str):
+        "Returns the cached response or None on a miss (unknown or expired key)."
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                    if row is not None:
+                        conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                        conn.commit()
+                    self.misses += 1
+                    return None
+                conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key))
+                conn.commit()
+                self.hits += 1
+                return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"WARN ORS cache read failed: {e}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value):
+        "Stores a response, then evicts the least recently used entries above max_entries."
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now)
+                )
+                if self.max_entries is not None:
+                    conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN ("
+                        f"SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,)
+                    )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"WARN ORS cache write failed: {e}")
+
+    def get_many(self, keys):
+        "Returns {key: response} for the keys found (and not expired), in a single query."
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                found = {}
+                for i in range(0, len(keys), SQL_IN_CHUNK):
+                    chunk = keys[i:i + SQL_IN_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    for key, value, created_at in conn.execute(
+                        f"SELECT key, value, created_at FROM {self.table} WHERE key IN ({placeholders})", chunk
+                    ):
+                        if self.ttl is None or now - created_at <= self.ttl:
+                            found[key] = json.loads(value)
+                conn.executemany(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"WARN ORS cache read failed: {e}")
+            found = {}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, items: dict):
+        "Stores several responses in one transaction, then evicts like set."
+        if not items:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    [(key, json.dumps(value), now, now) for key, value in items.items()]
+                )
+                if self.max_entries is not None:
+                    conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN ("
+                        f"SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,)
+                    )
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"WARN ORS cache write failed: {e}")
+
+    def recent(self, limit: int):
+        "The limit most recently used values (not expired), most recent first."
+        now = time.time()
+        try:
+            with self._lock:
+                rows = self._connect().execute(
+                    f"SELECT value, created_at FROM {self.table} ORDER BY last_used DESC LIMIT ?", (limit,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"WARN ORS cache read failed: {e}")
+            return []
+        return [json.loads(value) for value, created_at in rows if self.ttl is None or now - created_at <= self.ttl]
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        "Hit/miss counters and current size."
+        with self._lock:
+            size = self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": size,
+        }
+
+ors_cache = ResponseCache()
+directions_leg_cache = ResponseCache(max_entries=DIRECTIONS_LEG_CACHE_MAX_ENTRIES, table="directions_legs")
@@ -0,0 +1,189 @@
+# Outbound scheduler : per-endpoint token buckets, daily budgets and priorities for the ORS/Nominatim calls
+
+import asyncio
+import contextvars
+import datetime
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from backend.utils.constants import ORS_RATE_LIMITS, ORS_DAILY_BUDGETS, ORS_BACKGROUND_RESERVE, ORS_SCHEDULER_POLL
+
+INTERACTIVE = 0 # A user is waiting for the answer
+BACKGROUND = 1 # Warm-up and other work nobody waits for
+
+_priority = contextvars.ContextVar("ors_priority", default=INTERACTIVE)
+
+@contextmanager
+def background_priority():
+    "The ORS calls made inside (tasks and threads started from here included) wait behind interactive ones."
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+class OrsQuotaExceeded(Exception):
+    "The daily budget of an endpoint is spent (or, for background work, down to the interactive reserve)."
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"Daily ORS budget of {endpoint} exhausted")
+        self.endpoint = endpoint
+        self.retry_after = retry_after # Seconds until the budget resets
+
+def seconds_until_reset() -> int:
+    "Seconds until the next UTC midnight, when ORS resets the daily quotas."
+    now = datetime.datetime.now(datetime.timezone.utc)
+    tomorrow = (now + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((tomorrow - now).total_seconds()) + 1
+
+class EndpointQuota:
+    """
+    Token bucket of rate_limit calls per minute and daily budget of one endpoint.
+    Callers queue by (priority, arrival), only the head of the queue takes tokens.
+    """
+
+    def __init__(self, endpoint, rate_limit, daily_budget=None):
+        self.endpoint = endpoint
+        self.rate = rate_limit / 60
+        self.capacity = float(rate_limit)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0 # Set by a 429, no token is handed out before
+        self.daily_budget = daily_budget
+        self.day = None
+        self.used_today = 0
+        self.waiters = [] # heap of (priority, sequence)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _roll_day(self):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        if today != self.day:
+            self.day = today
+            self.used_today = 0
+
+    def remaining(self):
+        "Calls left today, None without a daily budget."
+        if self.daily_budget is None:
+            return None
+        self._roll_day()
+        return max(self.daily_budget - self.used_today, 0)
+
+    def check_budget(self, priority):
+        remaining = self.remaining()
+        if remaining is None:
+            return
+        reserve = self.daily_budget * ORS_BACKGROUND_RESERVE if priority == BACKGROUND else 0
+        if remaining <= reserve:
+            raise OrsQuotaExceeded(self.endpoint, seconds_until_reset())
+
+    def try_take(self, entry):
+        """
+        Takes a token if entry heads the queue and one is available.
+        Returns 0 once taken, otherwise the seconds worth waiting before trying again.
+        The budget is checked again, the calls queued before entry may have spent it :
+        entry then leaves the queue and OrsQuotaExceeded is raised.
+        """
+        now = time.monotonic()
+        if self.waiters[0] != entry:
+            return ORS_SCHEDULER_POLL
+        try:
+            self.check_budget(entry[0])
+        except OrsQuotaExceeded:
+            heapq.heappop(self.waiters)
+            raise
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        heapq.heappop(self.waiters)
+        if self.daily_budget is not None:
+            self.used_today += 1
+        return 0
+
+class OrsScheduler:
+    """
+    Every outbound call asks its endpoint for a slot first. Calls past the per-minute rate wait
+    (interactive ones first) instead of getting 429s, calls past the daily budget raise OrsQuotaExceeded.
+    """
+
+    def __init__(self, rate_limits=ORS_RATE_LIMITS, daily_budgets=ORS_DAILY_BUDGETS):
+        self.quotas = {
+            endpoint: EndpointQuota(endpoint, rate_limit, daily_budgets.get(endpoint))
+            for endpoint, rate_limit in rate_limits.items()
+        }
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, quota):
+        priority = _priority.get()
+        with self._lock:
+            quota.check_budget(priority)
+            entry = (priority, next(self._sequence))
+            heapq.heappush(quota.waiters, entry)
+        return entry
+
+    def _leave(self, quota, entry):
+        with self._lock:
+            if entry in quota.waiters:
+                quota.waiters.remove(entry)
+                heapq.heapify(quota.waiters)
+
+    def _try_take(self, quota, entry):
+        with self._lock:
+            return quota.try_take(entry)
+
+    async def acquire(self, endpoint):
+        "Waits for a slot of endpoint, endpoints without a quota go through right away."
+        quota = self.quotas.get(endpoint)
+        if quota is None:
+            return
+        entry = self._enqueue(quota)
+        try:
+            while (wait := self._try_take(quota, entry)):
+                await asyncio.sleep(min(wait, ORS_SCHEDULER_POLL))
+        except BaseException:
+            self._leave(quota, entry)
+            raise
+
+    def acquire_sync(self, endpoint):
+        "Blocking variant of acquire, for the calls made from worker threads."
+        quota = self.quotas.get(endpoint)
+        if quota is None:
+            return
+        entry = self._enqueue(quota)
+        try:
+            while (wait := self._try_take(quota, entry)):
+                time.sleep(min(wait, ORS_SCHEDULER_POLL))
+        except BaseException:
+            self._leave(quota, entry)
+            raise
+
+    def pause(self, endpoint, seconds):
+        "Holds every call to endpoint for seconds, after a 429 telling to retry later."
+        quota = self.quotas.get(endpoint)
+        if quota is not None:
+            with self._lock:
+                quota.paused_until = max(quota.paused_until, time.monotonic() + seconds)
+
+    def budget(self) -> dict:
+        "Remaining daily budget, rate and queued calls of each endpoint."
+        with self._lock:
+            return {
+                endpoint: {
+                    "daily_budget": quota.daily_budget,
+                    "remaining_today": quota.remaining(),
+                    "per_minute": round(quota.rate * 60),
+                    "waiting": len(quota.waiters),
+                }
+                for endpoint, quota in self.quotas.items()
+            }
+
+ors_scheduler = OrsScheduler()
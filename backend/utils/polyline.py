@@ -0,0 +1,76 @@
+# Compact route geometry : Douglas-Peucker simplification and Google encoded polylines
+
+import numpy as np
+
+from backend.utils.geometry import project_to_meters
+
+def simplify(coords, tolerance_m):
+    """
+    Douglas-Peucker simplification of a GeoJSON LineString.
+    coords = list of [lon, lat]
+    tolerance_m = maximal distance in meters between the original line and the simplified one
+
+    Returns the kept [lon, lat] pairs, first and last always included.
+    """
+    if tolerance_m <= 0 or len(coords) < 3:
+        return list(coords)
+    xy = project_to_meters(np.asarray(coords, dtype=np.float64)[:, ::-1])
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Iterative, long routes would overflow the recursion limit
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = xy[last] - xy[first]
+        offsets = xy[first + 1:last] - xy[first]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+
+    return [coords[i] for i in np.flatnonzero(keep)]
+
+def encode_polyline(coords, precision=5):
+    """
+    Google encoded polyline of a GeoJSON LineString.
+    coords = list of [lon, lat], encoded in the format's (lat, lon) order
+    precision = decimals kept, 5 is ~1 m and what most decoders expect
+    """
+    if not coords:
+        return ""
+    lat_lon = np.asarray(coords, dtype=np.float64)[:, ::-1]
+    scaled = np.round(lat_lon * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    chunks = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+def decode_polyline(encoded, precision=5):
+    "Inverse of encode_polyline, returns a list of [lon, lat]."
+    values = []
+    value, shift = 0, 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    lat_lon = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return lat_lon[:, ::-1].tolist()
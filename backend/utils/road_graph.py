@@ -0,0 +1,349 @@
+# Offline road routing on an OSM extract : CSR graph in NumPy arrays, A* and Dijkstra searches
+
+import heapq
+import os
+from math import asin, cos, sin, sqrt
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from dotenv import load_dotenv
+from sklearn.neighbors import BallTree
+
+from backend.utils.constants import CACHE_PATH, ROAD_GRAPH_DEFAULT_SPEED, ROAD_GRAPH_SNAP_RADIUS
+from backend.utils.geometry import EARTH_RADIUS_M
+
+# km/h on roads without a usable maxspeed, only these highway types are routed on
+HIGHWAY_SPEEDS = {
+    "motorway": 100, "trunk": 80, "primary": 60, "secondary": 50, "tertiary": 40,
+    "motorway_link": 60, "trunk_link": 50, "primary_link": 40, "secondary_link": 35, "tertiary_link": 30,
+    "unclassified": 30, "residential": 30, "living_street": 10, "service": 15, "road": 30,
+}
+
+def is_drivable(tags) -> bool:
+    return tags.get("highway") in HIGHWAY_SPEEDS and tags.get("access") not in ("no", "private") \
+        and tags.get("motor_vehicle") not in ("no", "private") and tags.get("area") != "yes"
+
+def way_speed(tags) -> float:
+    "Speed in km/h from the maxspeed tag, or the highway type default."
+    maxspeed = tags.get("maxspeed", "").split(" ")[0]
+    if maxspeed.isdigit():
+        speed = float(maxspeed)
+        return speed * 1.609 if "mph" in tags.get("maxspeed", "") else speed
+    return HIGHWAY_SPEEDS.get(tags.get("highway"), ROAD_GRAPH_DEFAULT_SPEED)
+
+def way_direction(tags) -> int:
+    "1 forward only, -1 backward only, 0 both ways."
+    oneway = tags.get("oneway")
+    if oneway in ("yes", "true", "1"):
+        return 1
+    if oneway == "-1":
+        return -1
+    if oneway is None and (tags.get("junction") == "roundabout" or tags.get("highway") == "motorway"):
+        return 1
+    return 0
+
+def read_osm_xml(path):
+    """
+    Streams the drivable ways of an .osm XML extract.
+    Yields (tags, [(node_id, lat, lon), ...]), elements are freed as they are read.
+    """
+    coordinates = {}
+    for _, elem in ET.iterparse(path, events=("end",)):
+        if elem.tag == "node":
+            coordinates[int(elem.get("id"))] = (float(elem.get("lat")), float(elem.get("lon")))
+            elem.clear()
+        elif elem.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+            if is_drivable(tags):
+                refs = [int(nd.get("ref")) for nd in elem.iter("nd")]
+                nodes = [(ref, *coordinates[ref]) for ref in refs if ref in coordinates]
+                if len(nodes) >= 2:
+                    yield tags, nodes
+            elem.clear()
+        elif elem.tag == "relation":
+            elem.clear()
+
+def read_osm_pbf(path):
+    "Same as read_osm_xml for .pbf extracts, needs the optional osmium package."
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Reading .pbf extracts requires the osmium package (pip install osmium)")
+
+    ways = []
+
+    class WayHandler(osmium.SimpleHandler):
+        def way(self, way):
+            tags = {tag.k: tag.v for tag in way.tags}
+            if is_drivable(tags):
+                nodes = [(node.ref, node.lat, node.lon) for node in way.nodes if node.location.valid()]
+                if len(nodes) >= 2:
+                    ways.append((tags, nodes))
+
+    WayHandler().apply_file(path, locations=True)
+    return ways
+
+class RoadGraph:
+    """
+    Directed road graph in CSR form : the edges leaving node i are
+    indices[indptr[i]:indptr[i + 1]], with their lengths (m) and durations (s).
+    """
+
+    def __init__(self, lats, lons, indptr, indices, lengths, durations):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.durations = np.asarray(durations, dtype=np.float32)
+        self.max_speed = float(np.max(self.lengths / np.maximum(self.durations, 1e-3))) if len(self.lengths) else 1.0
+        self._tree = None
+        self._adjacency = None
+        self._radians = None
+
+    @classmethod
+    def from_ways(cls, ways):
+        "Builds the graph from (tags, [(node_id, lat, lon), ...]) ways."
+        node_index = {}
+        lats, lons = [], []
+        sources, targets, speeds = [], [], []
+        for tags, nodes in ways:
+            speed = way_speed(tags) / 3.6
+            direction = way_direction(tags)
+            previous = None
+            for node_id, lat, lon in nodes:
+                if node_id not in node_index:
+                    node_index[node_id] = len(lats)
+                    lats.append(lat)
+                    lons.append(lon)
+                current = node_index[node_id]
+                if previous is not None:
+                    if direction >= 0:
+                        sources.append(previous); targets.append(current); speeds.append(speed)
+                    if direction <= 0:
+                        sources.append(current); targets.append(previous); speeds.append(speed)
+                previous = current
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        lats_array, lons_array = np.asarray(lats), np.asarray(lons)
+        lengths = _edge_lengths(lats_array, lons_array, sources, targets)
+        durations = lengths / np.asarray(speeds, dtype=np.float64)
+
+        order = np.argsort(sources, kind="stable")
+        indptr = np.zeros(len(lats) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(lats)), out=indptr[1:])
+        return cls(lats_array, lons_array, indptr, targets[order], lengths[order], durations[order])
+
+    @classmethod
+    def from_osm(cls, path):
+        reader = read_osm_pbf if path.endswith(".pbf") else read_osm_xml
+        return cls.from_ways(reader(path))
+
+    def save(self, path):
+        np.savez_compressed(path, lats=self.lats, lons=self.lons, indptr=self.indptr,
+                            indices=self.indices, lengths=self.lengths, durations=self.durations)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["lats"], data["lons"], data["indptr"], data["indices"], data["lengths"], data["durations"])
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _neighbours(self):
+        # Plain lists, indexing them from Python is much faster than NumPy scalars
+        if self._adjacency is None:
+            self._adjacency = (self.indptr.tolist(), self.indices.tolist(), self.lengths.tolist(), self.durations.tolist())
+        return self._adjacency
+
+    def _coordinates(self):
+        if self._radians is None:
+            self._radians = (np.radians(self.lats).tolist(), np.radians(self.lons).tolist())
+        return self._radians
+
+    def nearest_nodes(self, points, max_distance_m=ROAD_GRAPH_SNAP_RADIUS):
+        """
+        Snaps (lat, lon) points to their closest graph node.
+        Raises ValueError if a point is further than max_distance_m from any road.
+        """
+        if self._tree is None:
+            self._tree = BallTree(np.radians(np.column_stack((self.lats, self.lons))), metric="haversine")
+        distances, nodes = self._tree.query(np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2)), k=1)
+        distances = distances[:, 0] * EARTH_RADIUS_M
+        if np.any(distances > max_distance_m):
+            far = int(np.argmax(distances))
+            raise ValueError(f"Point {points[far]} is {distances[far]:.0f} m away from the road graph")
+        return nodes[:, 0].tolist()
+
+    def shortest_path(self, source, target, weight="duration"):
+        """
+        A* between two node indexes, on durations (s) or lengths (m).
+        Returns (nodes, distance_m, duration_s), raises ValueError if target can't be reached.
+        """
+        indptr, indices, lengths, durations = self._neighbours()
+        costs = durations if weight == "duration" else lengths
+        lats, lons = self._coordinates()
+        scale = 1.0 / self.max_speed if weight == "duration" else 1.0
+        target_lat, target_lon = lats[target], lons[target]
+        target_cos = cos(target_lat)
+
+        def heuristic(node):
+            # Straight-line distance (radians), never more than the road cost
+            a = sin((lats[node] - target_lat) / 2) ** 2 + cos(lats[node]) * target_cos * sin((lons[node] - target_lon) / 2) ** 2
+            return 2 * EARTH_RADIUS_M * asin(sqrt(min(a, 1.0))) * scale
+
+        best = {source: 0.0}
+        parents = {source: (None, 0.0, 0.0)} # node -> (previous, edge length, edge duration)
+        heap = [(heuristic(source), 0.0, source)]
+        settled = set()
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[edge]
+                new_cost = cost + costs[edge]
+                if new_cost < best.get(neighbour, float("inf")):
+                    best[neighbour] = new_cost
+                    parents[neighbour] = (node, lengths[edge], durations[edge])
+                    heapq.heappush(heap, (new_cost + heuristic(neighbour), new_cost, neighbour))
+        else:
+            if source != target:
+                raise ValueError(f"No road path between nodes {source} and {target}")
+
+        path, distance, duration = [], 0.0, 0.0
+        node = target
+        while node is not None:
+            path.append(node)
+            node, edge_length, edge_duration = parents[node]
+            distance += edge_length
+            duration += edge_duration
+        return path[::-1], distance, duration
+
+    def many_to_many(self, sources, targets, weight="duration"):
+        """
+        Costs between node indexes, one Dijkstra per distinct source stopped once every target is settled.
+        Returns (distances, durations) float32 arrays of shape (len(sources), len(targets)),
+        np.inf where unreachable. Meant for the stops of a route, not for whole-region matrices.
+        """
+        indptr, indices, lengths, durations = self._neighbours()
+        costs = durations if weight == "duration" else lengths
+        distance_matrix = np.full((len(sources), len(targets)), np.inf, dtype=np.float32)
+        duration_matrix = np.full((len(sources), len(targets)), np.inf, dtype=np.float32)
+        searched = {} # source node -> its row, stops snapped to the same node share it
+        for row, source in enumerate(sources):
+            if source in searched:
+                distance_matrix[row] = distance_matrix[searched[source]]
+                duration_matrix[row] = duration_matrix[searched[source]]
+                continue
+            searched[source] = row
+            remaining = {}
+            for column, target in enumerate(targets):
+                remaining.setdefault(target, []).append(column)
+            best = {source: (0.0, 0.0, 0.0)} # node -> (cost, distance, duration)
+            heap = [(0.0, source)]
+            settled = set()
+            while heap and remaining:
+                cost, node = heapq.heappop(heap)
+                if node in settled:
+                    continue
+                settled.add(node)
+                _, distance, duration = best[node]
+                for column in remaining.pop(node, []):
+                    distance_matrix[row, column] = distance
+                    duration_matrix[row, column] = duration
+                for edge in range(indptr[node], indptr[node + 1]):
+                    neighbour = indices[edge]
+                    new_cost = cost + costs[edge]
+                    if neighbour not in best or new_cost < best[neighbour][0]:
+                        best[neighbour] = (new_cost, distance + lengths[edge], duration + durations[edge])
+                        heapq.heappush(heap, (new_cost, neighbour))
+        return distance_matrix, duration_matrix
+
+    def directions(self, ordered_points):
+        """
+        Real-road route through the points, in the GeoJSON shape of the ORS directions endpoint
+        (one LineString feature with summary, segments and way_points).
+        ordered_points: list of (lat, lon) tuples in the optimized order.
+        """
+        nodes = self.nearest_nodes(ordered_points)
+        line = [nodes[0]]
+        way_points = [0]
+        segments = []
+        for source, target in zip(nodes, nodes[1:]):
+            path, distance, duration = self.shortest_path(source, target)
+            line.extend(path[1:])
+            way_points.append(len(line) - 1)
+            segments.append({"distance": round(distance, 1), "duration": round(duration, 1)})
+
+        coordinates = [[self.lons[node], self.lats[node]] for node in line]
+        return {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+                "properties": {
+                    "segments": segments,
+                    "summary": {
+                        "distance": round(sum(s["distance"] for s in segments), 1),
+                        "duration": round(sum(s["duration"] for s in segments), 1),
+                    },
+                    "way_points": way_points,
+                },
+            }],
+            "metadata": {"engine": "local road graph"},
+        }
+
+def _edge_lengths(lats, lons, sources, targets):
+    "Haversine length in meters of each (source, target) edge."
+    lat1, lat2 = np.radians(lats[sources]), np.radians(lats[targets])
+    dlat = lat2 - lat1
+    dlon = np.radians(lons[targets] - lons[sources])
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+_graph = None
+_graph_loaded = False # Set once ROAD_GRAPH_FILE was read (and its graph loaded if set)
+_graph_lock = threading.Lock()
+
+def load_road_graph(path):
+    """
+    Road graph of an extract. An OSM extract is converted on first use and the graph saved
+    as .npz in the cache directory, later starts load that file instead.
+    """
+    if path.endswith(".npz"):
+        return RoadGraph.load(path)
+    cached = os.path.join(CACHE_PATH, os.path.basename(path).split(".")[0] + "_graph.npz")
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+        return RoadGraph.load(cached)
+    print(f"Building road graph from {path}")
+    graph = RoadGraph.from_osm(path)
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    graph.save(cached)
+    return graph
+
+def get_road_graph():
+    """
+    The road graph of the ROAD_GRAPH_FILE env variable (.osm/.xml/.pbf extract or a graph .npz
+    built from one), loaded once. None when no extract is configured.
+    The variable is read at the first call, after the .env file is loaded.
+    Loading can take a while, call it from a worker thread.
+    """
+    global _graph, _graph_loaded
+    if _graph_loaded:
+        return _graph
+    with _graph_lock:
+        if not _graph_loaded:
+            load_dotenv()
+            path = os.getenv("ROAD_GRAPH_FILE")
+            if path:
+                _graph = load_road_graph(path)
+                print(f"Road graph loaded : {len(_graph)} nodes, {len(_graph.indices)} edges")
+            _graph_loaded = True
+        return _graph
@@ -0,0 +1,103 @@
+# Server-side state of planned routes, re-planned from the canvasser's position as stops get visited
+
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from backend.utils.constants import ROUTE_SESSION_TTL, ROUTE_SESSION_MAX, REPLAN_TIME_BUDGET
+from backend.utils.geometry import haversine_matrix, haversine_to_many, as_latlon_array
+from backend.utils.tsp import solve_tour
+
+class RouteSession:
+    """
+    A planned route : its stops, their current visiting order and which were visited.
+    Only the ids and coordinates are kept, the straight-line distances between the
+    remaining stops are computed at each re-plan (sessions that are never re-planned cost nothing).
+    """
+
+    def __init__(self, order, stops):
+        self.id = uuid.uuid4().hex
+        self.order = list(order) # profile ids, visiting order
+        self.stops = dict(stops) # profile id -> (lat, lon)
+        self.visited = set()
+        self.last_used = time.time()
+        self._position = {profile_id: pos for pos, profile_id in enumerate(self.stops)}
+        self._coords = as_latlon_array(list(self.stops.values()))
+        self._lock = threading.Lock()
+
+    def mark_visited(self, profile_ids):
+        with self._lock:
+            self.visited.update(profile_id for profile_id in profile_ids if profile_id in self.stops)
+
+    def remaining(self):
+        return [profile_id for profile_id in self.order if profile_id not in self.visited]
+
+    def replan(self, lat, lon, time_budget=REPLAN_TIME_BUDGET):
+        """
+        Re-orders the unvisited stops from (lat, lon), warm-started from the current order.
+        Returns the new order of the remaining profile ids, also kept as the session order.
+        """
+        with self._lock:
+            remaining = self.remaining()
+            if len(remaining) > 1:
+                rows = [self._position[profile_id] for profile_id in remaining]
+                # Node 0 is the current position, node i the i-th remaining stop
+                matrix = np.zeros((len(rows) + 1, len(rows) + 1), dtype=np.float32)
+                matrix[0, 1:] = matrix[1:, 0] = haversine_to_many(lat, lon, self._coords[rows, 0], self._coords[rows, 1])
+                matrix[1:, 1:] = haversine_matrix(self._coords[rows])
+                tour = solve_tour(matrix, start=0, time_budget=time_budget, initial_order=range(1, len(rows) + 1))
+                remaining = [remaining[node - 1] for node in tour[1:]]
+            self.order = [profile_id for profile_id in self.order if profile_id in self.visited] + remaining
+            self.last_used = time.time()
+            return remaining
+
+    def to_dict(self):
+        return {
+            "session_id": self.id,
+            "order": self.order,
+            "visited": [profile_id for profile_id in self.order if profile_id in self.visited],
+            "remaining": self.remaining(),
+        }
+
+class RouteSessionStore:
+    "In-memory sessions, forgotten ttl seconds after their last use, oldest dropped above max_sessions."
+
+    def __init__(self, ttl=ROUTE_SESSION_TTL, max_sessions=ROUTE_SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, order, stops) -> RouteSession:
+        session = RouteSession(order, stops)
+        with self._lock:
+            self._purge()
+            self._sessions[session.id] = session
+            if len(self._sessions) > self.max_sessions:
+                oldest = min(self._sessions.values(), key=lambda s: s.last_used)
+                del self._sessions[oldest.id]
+        return session
+
+    def get(self, session_id):
+        "The session, or None if unknown or expired."
+        with self._lock:
+            self._purge()
+            session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.time()
+        return session
+
+    def mark_visited(self, session_id, profile_id):
+        "Hook for the visits routes, ignores unknown sessions."
+        session = self.get(session_id)
+        if session is not None:
+            session.mark_visited([profile_id])
+
+    def _purge(self):
+        now = time.time()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_used > self.ttl]:
+            del self._sessions[session_id]
+
+route_sessions = RouteSessionStore()
@@ -3,7 +3,7 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from backend.database.models import User, Device
 from backend.utils.security import verify_password, create_access_token, create_refresh_token
-import backend.database as db_module
+from backend.utils.dependencies import get_db
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -11,13 +11,6 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
-def get_db():
-    db = db_module.SessionLocal()
-    print(str(db_module.SessionLocal.kw['bind'].url))
-    try:
-        yield db
-    finally:
-        db.close()
 """
 @router.post("/login")
 def login(payload: LoginRequest, request: Request, db: Session = Depends(get_db)):
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from pydantic import BaseModel
 from backend.utils.dropbox import user_login, user_upload_db, register_user, reset_password
@@ -77,14 +80,18 @@ async def upload_db(
     Upload and register a SQLite database for a given user.
     Stores file in Dropbox and updates user_session.json.
     """
-    # Save temporarily in /tmp
-    temp_path = f"/tmp/{username}.db"
-    with open(temp_path, "wb") as f:
+    # Saved aside first, the database in use is only replaced once the credentials are checked
+    # and the upload to Dropbox succeeded
+    fd, temp_path = tempfile.mkstemp(prefix="upload-", suffix=".db", dir="/tmp")
+    with os.fdopen(fd, "wb") as f:
         f.write(await file.read())
 
     try:
-        user_upload_db(username, password, temp_path)
-        current_files["db"] = temp_path
-        return {"status": "success", "path": temp_path}
+        local_db = user_upload_db(username, password, temp_path)
+        current_files["db"] = local_db
+        return {"status": "success", "path": local_db}
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
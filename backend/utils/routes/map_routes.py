@@ -1,13 +1,31 @@
+import asyncio
+import json
+
 from fastapi import APIRouter, Body, Query, HTTPException
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy import and_
-import httpx
 
 import backend.database as db_module
 from backend.database.models import Profile
-from backend.utils.geo import get_optimized_route, display_route_on_map
-from backend.utils.clustered_geo import cluster_points, combine_cluster_routes, display_clustered_route
+from backend.database.projections import marker_query
+from backend.database.spatial import bbox_filter, radius_bbox, distance_order
+from backend.utils.constants import MAX_ORS_STOPS, MAX_LOCAL_STOPS, MAX_TEAM_SIZE, ROUTE_SIMPLIFY_TOLERANCE, POLYLINE_PRECISION
+from backend.utils.geometry import haversine_to_many
+from backend.utils.geo import (get_optimized_route_async, get_local_optimized_route, display_route_on_map_async,
+                               ordered_route_stops, get_directions_route_async, NOMINATIM_SEARCH_URL)
+from backend.utils.clustered_geo import cluster_points, split_team_territories, stream_clustered_route, combine_cluster_routes_async, display_clustered_route_async
+from backend.utils.http_client import request_with_retry
+from backend.utils.matrix_store import get_road_matrix
+from backend.utils.polyline import simplify, encode_polyline
+from backend.utils.jobs import job_queue
+from backend.utils.route_sessions import route_sessions
+from backend.utils.warmup import log_route_request
+from backend.utils.metrics import timed
+from backend.utils.ors_scheduler import ors_scheduler, OrsQuotaExceeded
 
 router = APIRouter()
 
@@ -15,12 +33,38 @@ class RouteRequest(BaseModel):
     start_lat: float
     start_lon: float
     filters: Optional[Dict[str, Any]] = None
+    solver: str = "ors" # "ors" or "local"
+    road_matrix: bool = False # local solver only, order on ORS road durations instead of straight lines
+    radius_m: Optional[float] = None # only profiles within this distance of the start
+    bbox: Optional[List[float]] = None # [min_lat, min_lon, max_lat, max_lon]
+    max_stops: Optional[int] = None # nearest stops kept, defaults to MAX_ORS_STOPS (ORS) or MAX_LOCAL_STOPS (local) per route
+    geometry: str = "coordinates" # "coordinates" ([lon, lat] list) or "polyline" (Google encoded)
+    simplify_m: Optional[float] = None # Douglas-Peucker tolerance, defaults to ROUTE_SIMPLIFY_TOLERANCE in polyline mode
+    team_size: Optional[int] = None # canvassers sharing the start, one balanced route each
+    starts: Optional[List[List[float]]] = None # [[lat, lon], ...] one start per canvasser, overrides team_size
 
-@router.post("/profiles/optimize")
-def optimize_profiles(req: RouteRequest = Body(...)):
+@timed("geometry")
+def route_geometry(coordinates, req: RouteRequest):
+    """
+    Route geometry in the requested format.
+    "coordinates" : {"coordinates": [[lon, lat], ...]}, as ORS returns it
+    "polyline" : {"polyline": str, "precision": int}, simplified then encoded, a fraction of the size
+    """
+    tolerance = req.simplify_m
+    if tolerance is None and req.geometry == "polyline":
+        tolerance = ROUTE_SIMPLIFY_TOLERANCE
+    if tolerance:
+        coordinates = simplify(coordinates, tolerance)
+    if req.geometry == "polyline":
+        return {"polyline": encode_polyline(coordinates, POLYLINE_PRECISION), "precision": POLYLINE_PRECISION}
+    return {"coordinates": coordinates}
+
+@timed("db_query")
+def query_profiles(req: RouteRequest):
+    "Loads the marker rows (see backend.database.projections) of the profiles matching the request filters."
     db = db_module.SessionLocal()
     try:
-        query = db.query(Profile)
+        query = marker_query(db)
 
         # allow synonyms
         alias_map = {
@@ -65,39 +109,38 @@ def optimize_profiles(req: RouteRequest = Body(...)):
         if clauses:
             query = query.filter(and_(*clauses))
 
+        # Geographic pre-filter, only the nearest matching stops are loaded
+        query = query.filter(Profile.latitude.isnot(None), Profile.longitude.isnot(None))
+        if req.bbox:
+            query = bbox_filter(query, *req.bbox)
+        if req.radius_m:
+            query = bbox_filter(query, *radius_bbox(req.start_lat, req.start_lon, req.radius_m))
+        query = query.order_by(distance_order(req.start_lat, req.start_lon))
+
+        max_stops = req.max_stops
+        if max_stops is None:
+            max_stops = (MAX_ORS_STOPS if req.solver == "ors" else MAX_LOCAL_STOPS) * len(team_starts(req))
+        query = query.limit(max_stops)
+
         profiles = query.all()
     finally:
         db.close()
 
-    if not profiles:
-        return {"message": "No matching profiles found."}
-    elif len(profiles) > 45 :
-        profiles = profiles[:45]
-        print("Trimmed profiles to 45 points")
-    points, profile_ids, profiles_map = [], [], {}
-    for p in profiles:
-        if p.latitude is None or p.longitude is None:
-            continue
-        points.append((p.latitude, p.longitude))
-        profile_ids.append(p.id)
-        profiles_map[p.id] = (p.latitude, p.longitude)
-
-    if not points:
-        return {"message": "No profiles with valid coordinates."}
+    if req.radius_m and profiles:
+        # The box corners are further than the radius
+        distances = haversine_to_many(req.start_lat, req.start_lon, [p.latitude for p in profiles], [p.longitude for p in profiles])
+        profiles = [p for p, dist in zip(profiles, distances) if dist <= req.radius_m]
+    return profiles
 
-    start_coord = (req.start_lat, req.start_lon)
+def team_starts(req: RouteRequest):
+    "Start coordinate of each canvasser, a single one unless starts or team_size are given."
+    if req.starts:
+        return [tuple(start) for start in req.starts]
+    return [(req.start_lat, req.start_lon)] * (req.team_size or 1)
 
-    if len(points) > 30:
-        clusters = cluster_points(points, max_cluster_size=50)
-        full_ordered_points, cluster_results = combine_cluster_routes(
-            start_coord, clusters, points, profile_ids
-        )
-        route_geojson = display_clustered_route(full_ordered_points, cluster_results, start_coord=start_coord)
-    else :
-        result, id_map = get_optimized_route(start_coord[0], start_coord[1], points=points, profile_ids=profile_ids)
-        route_geojson = display_route_on_map(result, id_map, profiles_map, start_coord=start_coord)
-    
-    # Build markers
+@timed("markers")
+def build_markers(profiles):
+    "Map markers of the profiles, in the given order."
     markers = []
     for p in profiles:
         if p.latitude is None or p.longitude is None:
@@ -118,25 +161,302 @@ def optimize_profiles(req: RouteRequest = Body(...)):
             "strategic_profile": p.strategic_profile,
             "picture_url": p.picture_url,
         })
+    return markers
 
-    # Extract coordinates from GeoJSON
+def route_coordinates(route_geojson):
+    "[lon, lat] coordinates of a route GeoJSON, single \"route\" LineString or FeatureCollection."
     coordinates = []
+    route_geojson = route_geojson or {}
+    if "route" in route_geojson:
+        coordinates.extend(route_geojson["route"].get("coordinates", []))
     for feature in route_geojson.get("features", []):
         geom = feature.get("geometry", {})
         if geom.get("type") == "LineString":
             coordinates.extend(geom.get("coordinates", []))
+    return coordinates
+
+async def plan_route(points, profile_ids, profiles_map, start_coord, req: RouteRequest, progress=None, rows=None):
+    """
+    Orders the stops of one canvasser.
+    progress = optional job (see backend.utils.jobs), counts the optimized clusters
+    rows = {profile id: marker row} already loaded, the route display doesn't query them again
+    Returns (ordered_ids, coordinates) : the profile ids in visiting order and the route [lon, lat] coordinates.
+    """
+    clustered = req.solver == "ors" and len(points) > 30
+    if progress and not clustered:
+        progress.add_work(1)
+
+    if req.solver == "local":
+        matrix = None
+        if req.road_matrix:
+            _, matrix = await get_road_matrix(profile_ids, points, start=start_coord)
+        result, id_map = await run_in_threadpool(
+            get_local_optimized_route, start_coord[0], start_coord[1], points=points, profile_ids=profile_ids, matrix=matrix
+        )
+        _, ordered_ids = ordered_route_stops(result, id_map, profiles_map)
+        route_geojson = await display_route_on_map_async(result, id_map, profiles_map, start_coord=start_coord, rows=rows)
+    elif clustered:
+        clusters = await run_in_threadpool(cluster_points, points, max_cluster_size=50)
+        full_ordered_points, cluster_results = await combine_cluster_routes_async(
+            start_coord, clusters, points, profile_ids, progress=progress
+        )
+        ordered_ids = [profile_id for _, cluster_ids in cluster_results for profile_id in cluster_ids]
+        route_geojson = await display_clustered_route_async(full_ordered_points, cluster_results, start_coord=start_coord)
+    else :
+        result, id_map = await get_optimized_route_async(start_coord[0], start_coord[1], points=points, profile_ids=profile_ids)
+        _, ordered_ids = ordered_route_stops(result, id_map, profiles_map)
+        route_geojson = await display_route_on_map_async(result, id_map, profiles_map, start_coord=start_coord, rows=rows)
+    if progress and not clustered:
+        progress.work_done()
+    return ordered_ids, route_coordinates(route_geojson)
+
+def open_session(ordered_ids, profiles_map):
+    "Route session of a planned route (see /profiles/optimize/sessions), None if nothing was ordered."
+    if not ordered_ids:
+        return None
+    return route_sessions.create(ordered_ids, {profile_id: profiles_map[profile_id] for profile_id in ordered_ids}).id
+
+def validate_route_request(req: RouteRequest):
+    if req.solver not in ("ors", "local"):
+        raise HTTPException(status_code=400, detail=f"Invalid solver: {req.solver}")
+    if req.geometry not in ("coordinates", "polyline"):
+        raise HTTPException(status_code=400, detail=f"Invalid geometry: {req.geometry}")
+    if req.bbox is not None and len(req.bbox) != 4:
+        raise HTTPException(status_code=400, detail="bbox must be [min_lat, min_lon, max_lat, max_lon]")
+    if req.starts is not None and (not req.starts or any(len(start) != 2 for start in req.starts)):
+        raise HTTPException(status_code=400, detail="starts must be a list of [lat, lon]")
+    if req.starts is not None and len(req.starts) > MAX_TEAM_SIZE:
+        raise HTTPException(status_code=400, detail=f"starts is limited to {MAX_TEAM_SIZE} members")
+    if req.team_size is not None and not 1 <= req.team_size <= MAX_TEAM_SIZE:
+        raise HTTPException(status_code=400, detail=f"team_size must be between 1 and {MAX_TEAM_SIZE}")
+    if req.max_stops is not None and req.max_stops < 1:
+        raise HTTPException(status_code=400, detail="max_stops must be positive")
+    # The local solver holds a dense matrix of the stops of each route,
+    # ORS routes cost optimization and directions calls out of the daily budgets
+    per_route = MAX_LOCAL_STOPS if req.solver == "local" else MAX_ORS_STOPS
+    if req.max_stops is not None and req.max_stops > per_route * len(team_starts(req)):
+        raise HTTPException(status_code=400, detail=f"max_stops is limited to {per_route} per route with the {req.solver} solver")
+
+def stops_of(profiles):
+    "(points, profile_ids, profiles_map) of the profiles with coordinates."
+    points, profile_ids, profiles_map = [], [], {}
+    for p in profiles:
+        if p.latitude is None or p.longitude is None:
+            continue
+        points.append((p.latitude, p.longitude))
+        profile_ids.append(p.id)
+        profiles_map[p.id] = (p.latitude, p.longitude)
+    return points, profile_ids, profiles_map
+
+async def compute_route(req: RouteRequest, progress=None, open_sessions=True):
+    """
+    Response of /profiles/optimize, shared with the job queue and the warm-up.
+    open_sessions = False skips the route sessions, for routes nobody will follow
+    """
+    # Database and CPU bound steps run in the threadpool, ORS calls are awaited
+    profiles = await run_in_threadpool(query_profiles, req)
 
+    if not profiles:
+        return {"message": "No matching profiles found."}
+    points, profile_ids, profiles_map = stops_of(profiles)
+
+    if not points:
+        return {"message": "No profiles with valid coordinates."}
+    rows = {p.id: p for p in profiles}
+
+    starts = team_starts(req)
+    if len(starts) == 1:
+        ordered_ids, coordinates = await plan_route(points, profile_ids, profiles_map, starts[0], req, progress, rows)
+        return {
+            "start": {"lat": starts[0][0], "lon": starts[0][1]},
+            "route": route_geometry(coordinates, req),
+            "markers": build_markers(profiles),
+            "session_id": open_session(ordered_ids, profiles_map) if open_sessions else None,
+        }
+
+    # One balanced territory per canvasser, routed concurrently
+    territories = await run_in_threadpool(split_team_territories, points, starts)
+    markers = build_markers(profiles)
+    markers_by_id = {marker["id"]: marker for marker in markers}
+
+    async def plan_territory(start_coord, territory):
+        if not territory:
+            return [], []
+        return await plan_route(
+            [points[i] for i in territory], [profile_ids[i] for i in territory], profiles_map, start_coord, req, progress, rows
+        )
+
+    planned = await asyncio.gather(*[
+        plan_territory(start_coord, territory) for start_coord, territory in zip(starts, territories)
+    ])
+    routes = []
+    for start_coord, territory, (ordered_ids, coordinates) in zip(starts, territories, planned):
+        routes.append({
+            "start": {"lat": start_coord[0], "lon": start_coord[1]},
+            "route": route_geometry(coordinates, req),
+            "markers": [markers_by_id[profile_ids[i]] for i in territory],
+            "session_id": open_session(ordered_ids, profiles_map) if open_sessions else None,
+        })
     return {
         "start": {"lat": req.start_lat, "lon": req.start_lon},
-        "route": {"coordinates": coordinates},
+        "routes": routes,
         "markers": markers,
     }
 
+@router.post("/profiles/optimize")
+async def optimize_profiles(req: RouteRequest = Body(...)):
+    validate_route_request(req)
+    await run_in_threadpool(log_route_request, req)
+    result = await compute_route(req)
+    with timed("json_encode"):
+        return JSONResponse(jsonable_encoder(result))
+
+@router.post("/profiles/optimize/jobs", status_code=202)
+async def submit_optimize_job(req: RouteRequest = Body(...)):
+    """
+    Queues the /profiles/optimize computation and answers right away.
+    Poll /profiles/optimize/jobs/{job_id}, then fetch .../result once done.
+    """
+    validate_route_request(req)
+    await run_in_threadpool(log_route_request, req)
+    try:
+        job = job_queue.submit(lambda job: compute_route(req, progress=job))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many route computations queued, retry later")
+    return job.to_dict()
+
+def get_job_or_404(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+@router.get("/profiles/optimize/jobs/{job_id}")
+async def optimize_job_status(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+@router.get("/profiles/optimize/jobs/{job_id}/result")
+async def optimize_job_result(job_id: str):
+    job = get_job_or_404(job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Route computation failed: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.result
+
+def ndjson(event) -> bytes:
+    return (json.dumps(event) + "\n").encode("utf-8")
+
+@router.post("/profiles/optimize/stream")
+async def optimize_profiles_stream(req: RouteRequest = Body(...)):
+    """
+    Streaming variant of /profiles/optimize, one JSON object per line (NDJSON) :
+    {"type": "markers", "start", "markers"} first, then the route as {"type": "cluster",
+    "index", "stops", "route"} pieces in visiting order as soon as they are computed
+    (a single piece for unclustered routes), then {"type": "done", "session_id"}.
+    {"type": "message", "message"} replaces the route when there is nothing to plan.
+    The request is validated and the profiles queried before the response starts, so those
+    errors keep their status code. Later failures end the stream with {"type": "error", "status", "detail"}.
+    """
+    validate_route_request(req)
+    if len(team_starts(req)) > 1:
+        raise HTTPException(status_code=400, detail="Team planning isn't streamed, use /profiles/optimize")
+    await run_in_threadpool(log_route_request, req)
+    profiles = await run_in_threadpool(query_profiles, req)
+
+    async def route_events():
+        points, profile_ids, profiles_map = stops_of(profiles)
+        if not points:
+            yield ndjson({"type": "message", "message": "No matching profiles found."})
+            return
+
+        start_coord = (req.start_lat, req.start_lon)
+        yield ndjson({
+            "type": "markers",
+            "start": {"lat": req.start_lat, "lon": req.start_lon},
+            "markers": build_markers(profiles),
+        })
+
+        route_ids = []
+        if req.solver == "ors" and len(points) > 30:
+            clusters = await run_in_threadpool(cluster_points, points, max_cluster_size=50)
+            async for position, _, ordered_ids, features in stream_clustered_route(start_coord, clusters, points, profile_ids):
+                route_ids += ordered_ids
+                yield ndjson({
+                    "type": "cluster",
+                    "index": position,
+                    "stops": ordered_ids,
+                    "route": route_geometry(route_coordinates({"features": features}), req),
+                })
+        else:
+            route_ids, coordinates = await plan_route(points, profile_ids, profiles_map, start_coord, req)
+            yield ndjson({"type": "cluster", "index": 0, "stops": route_ids, "route": route_geometry(coordinates, req)})
+        yield ndjson({"type": "done", "session_id": open_session(route_ids, profiles_map)})
+
+    async def events():
+        # The 200 and its headers are already sent, failures can only be reported in the stream
+        try:
+            async for event in route_events():
+                yield event
+        except OrsQuotaExceeded as e:
+            yield ndjson({"type": "error", "status": 503, "detail": str(e), "retry_after": e.retry_after})
+        except HTTPException as e:
+            yield ndjson({"type": "error", "status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            print(f"ERROR Streamed route failed : {e}")
+            yield ndjson({"type": "error", "status": 500, "detail": "Route planning failed"})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+class ReplanRequest(BaseModel):
+    current_lat: float
+    current_lon: float
+    visited: Optional[List[int]] = None # profile ids visited since the last call
+    directions: bool = True # road geometry of the remaining route, only the first leg is usually not cached
+    geometry: str = "coordinates" # same as RouteRequest
+    simplify_m: Optional[float] = None
+
+def get_session_or_404(session_id: str):
+    session = route_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired route session")
+    return session
+
+@router.get("/profiles/optimize/sessions/{session_id}")
+async def route_session_state(session_id: str):
+    return get_session_or_404(session_id).to_dict()
+
+@router.post("/profiles/optimize/sessions/{session_id}/replan")
+async def replan_route_session(session_id: str, req: ReplanRequest = Body(...)):
+    """
+    Re-orders the unvisited stops of a planned route from the canvasser's position,
+    warm-started from the previous order on straight-line distances between the remaining stops
+    computed for this call, no optimization call.
+    """
+    if req.geometry not in ("coordinates", "polyline"):
+        raise HTTPException(status_code=400, detail=f"Invalid geometry: {req.geometry}")
+    session = get_session_or_404(session_id)
+    if req.visited:
+        session.mark_visited(req.visited)
+    remaining = await run_in_threadpool(session.replan, req.current_lat, req.current_lon)
+
+    response = session.to_dict()
+    response["start"] = {"lat": req.current_lat, "lon": req.current_lon}
+    if req.directions and remaining:
+        route_geojson = await get_directions_route_async(
+            [(req.current_lat, req.current_lon)] + [session.stops[profile_id] for profile_id in remaining]
+        )
+        response["route"] = route_geometry(route_coordinates(route_geojson), req)
+    return response
+
+@router.get("/ors/quota")
+def get_ors_quota():
+    "Remaining daily ORS budget, rate limit and queued calls per endpoint."
+    return ors_scheduler.budget()
+
 @router.get("/geocode")
 async def geocode_address(q: str = Query(..., description="The address to geocode")):
-    url = f"https://nominatim.openstreetmap.org/search?format=json&q={q}"
     headers = {"User-Agent": "YourAppName/1.0 (contact@example.com)"}
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url, headers=headers)
-        r.raise_for_status()
-        return r.json()
+    r = await request_with_retry("GET", NOMINATIM_SEARCH_URL, params={"format": "json", "q": q}, headers=headers)
+    r.raise_for_status()
+    return r.json()
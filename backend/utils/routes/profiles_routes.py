@@ -1,23 +1,16 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy.inspection import inspect
 from fastapi.responses import StreamingResponse
 import csv
 import io
 
-import backend.database as db_module
+from backend.utils.dependencies import get_db
 from backend.database.models import Profile, FieldMetadata
+from backend.database.spatial import profiles_within_radius, nearest_profiles
 
 router = APIRouter(prefix="/profiles", tags=["profiles"])
 
-def get_db():
-    db = db_module.SessionLocal() # Persistent link
-    print(str(db_module.SessionLocal.kw['bind'].url))
-    try:
-        yield db
-    finally:
-        db.close()
-
 def get_filtered_profiles(
     db: Session,
     score_min: int | None = None,
@@ -36,6 +29,19 @@ def get_filtered_profiles(
 
     return query
 
+def coerce_filter_value(column, field, value):
+    "Converts a query parameter to the Python type of the column it filters, 400 if it can't."
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is str:
+        return value
+    try:
+        return python_type(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid value for {field} : {value!r}")
+
 @router.get("/fields")
 def list_profile_fields():
     """
@@ -55,35 +61,49 @@ def list_all_profiles(db: Session = Depends(get_db)):
 
 @router.get("/")
 def list_profiles(
+    request: Request,
     db: Session = Depends(get_db),
     limit: int = Query(20),
     offset: int = Query(0),
-    **filters
+    near_lat: float | None = Query(None, description="Rank profiles by distance from this point"),
+    near_lon: float | None = Query(None),
+    radius_m: float | None = Query(None, description="Only profiles within this distance of near_lat/near_lon"),
 ):
     query = db.query(Profile)
 
+    # Any other query parameter is a filter on a Profile field
+    reserved = {"limit", "offset", "near_lat", "near_lon", "radius_m"}
+    filters = {field: value for field, value in request.query_params.items() if field not in reserved}
+
+    # Only real columns can be filtered, relationships and other class attributes are ignored
+    columns = inspect(Profile).columns
+
     # Apply filters dynamically
     for field, value in filters.items():
-        if not hasattr(Profile, field) or value is None:
-            continue
-        column = getattr(Profile, field)
-
         # Support numeric ranges (min/max)
-        if field.endswith("_min"):
-            base_field = field[:-4]
-            if hasattr(Profile, base_field):
-                query = query.filter(getattr(Profile, base_field) >= value)
-        elif field.endswith("_max"):
-            base_field = field[:-4]
-            if hasattr(Profile, base_field):
-                query = query.filter(getattr(Profile, base_field) <= value)
-        else:
-            # Fuzzy match for strings
+        if field.endswith(("_min", "_max")) and field[:-4] in columns:
+            column = getattr(Profile, field[:-4])
+            value = coerce_filter_value(columns[field[:-4]], field, value)
+            query = query.filter(column >= value if field.endswith("_min") else column <= value)
+        elif field in columns:
+            column = getattr(Profile, field)
+            value = coerce_filter_value(columns[field], field, value)
+            # Fuzzy match for strings, exact match for numbers
             if isinstance(value, str):
                 query = query.filter(column.ilike(f"%{value}%"))
             else:
                 query = query.filter(column == value)
 
+    if near_lat is not None and near_lon is not None:
+        # Spatial index lookup, then one query for the requested page in distance order
+        if radius_m is not None:
+            ranked = profiles_within_radius(query, near_lat, near_lon, radius_m)[offset:offset + limit]
+        else:
+            ranked = nearest_profiles(query, near_lat, near_lon, offset + limit)[offset:]
+        page_ids = [profile_id for profile_id, _ in ranked]
+        by_id = {p.id: p for p in db.query(Profile).filter(Profile.id.in_(page_ids)).all()}
+        return [by_id[profile_id] for profile_id in page_ids if profile_id in by_id]
+
     return query.offset(offset).limit(limit).all()
 
 @router.get("/export")
@@ -0,0 +1,157 @@
+# Local route solver, orders stops from a distance matrix without calling ORS
+
+import time
+
+from backend.utils.constants import LOCAL_SOLVER_TIME_BUDGET
+
+EPSILON = 1e-9
+
+def _as_rows(matrix):
+    "Plain nested lists are much faster than numpy arrays for scalar lookups."
+    return matrix.tolist() if hasattr(matrix, "tolist") else [list(row) for row in matrix]
+
+def _symmetrized(dist):
+    n = len(dist)
+    if all(dist[i][j] == dist[j][i] for i in range(n) for j in range(i + 1, n)):
+        return dist
+    return [[(dist[i][j] + dist[j][i]) / 2 for j in range(n)] for i in range(n)]
+
+def _leg(dist, a, b):
+    "Cost of a leg, an open end (None) costs nothing."
+    if a is None or b is None:
+        return 0.0
+    return dist[a][b]
+
+def tour_cost(matrix, tour, loop_at_start=False):
+    "Total cost of visiting the nodes of tour in order."
+    dist = _as_rows(matrix)
+    cost = sum(dist[a][b] for a, b in zip(tour, tour[1:]))
+    if loop_at_start and len(tour) > 1:
+        cost += dist[tour[-1]][tour[0]]
+    return cost
+
+def nearest_neighbour_tour(dist, start, nodes):
+    "Construction heuristic : always drive to the closest unvisited node."
+    tour = [start]
+    remaining = set(nodes)
+    current = start
+    while remaining:
+        current = min(remaining, key=lambda node: dist[current][node])
+        remaining.remove(current)
+        tour.append(current)
+    return tour
+
+def two_opt(dist, tour, fixed_end, loop_at_start, deadline):
+    """
+    Reverses tour segments as long as it shortens the tour.
+    The start (and the end if fixed) never move.
+    Returns True if the tour was improved.
+    """
+    last_mobile = len(tour) - 2 if fixed_end else len(tour) - 1
+    improved = False
+    for i in range(1, last_mobile):
+        if time.perf_counter() > deadline:
+            break
+        for j in range(i + 1, last_mobile + 1):
+            a, b, c = tour[i - 1], tour[i], tour[j]
+            if j + 1 < len(tour):
+                d = tour[j + 1]
+            else:
+                d = tour[0] if loop_at_start else None
+            delta = _leg(dist, a, c) + _leg(dist, b, d) - _leg(dist, a, b) - _leg(dist, c, d)
+            if delta < -EPSILON:
+                tour[i:j + 1] = reversed(tour[i:j + 1])
+                improved = True
+    return improved
+
+def or_opt(dist, tour, fixed_end, loop_at_start, deadline, max_segment=3):
+    """
+    Moves chains of 1 to max_segment consecutive nodes to a cheaper position.
+    Chains keep their direction, so the deltas stay exact on asymmetric matrices.
+    Returns True if the tour was improved.
+    """
+    improved = False
+    for seg_len in range(1, max_segment + 1):
+        i = 1
+        while True:
+            last_mobile = len(tour) - 2 if fixed_end else len(tour) - 1
+            if i + seg_len - 1 > last_mobile or time.perf_counter() > deadline:
+                break
+            segment = tour[i:i + seg_len]
+            rest = tour[:i] + tour[i + seg_len:]
+            prev = rest[i - 1]
+            if i < len(rest):
+                nxt = rest[i]
+            else:
+                nxt = rest[0] if loop_at_start else None
+            removal_gain = _leg(dist, prev, segment[0]) + _leg(dist, segment[-1], nxt) - _leg(dist, prev, nxt)
+
+            best_k, best_delta = None, -EPSILON
+            last_k = len(rest) - 2 if fixed_end else len(rest) - 1
+            for k in range(0, last_k + 1):
+                if k == i - 1:
+                    continue
+                before = rest[k]
+                if k + 1 < len(rest):
+                    after = rest[k + 1]
+                else:
+                    after = rest[0] if loop_at_start else None
+                delta = (_leg(dist, before, segment[0]) + _leg(dist, segment[-1], after)
+                         - _leg(dist, before, after) - removal_gain)
+                if delta < best_delta:
+                    best_k, best_delta = k, delta
+
+            if best_k is not None:
+                tour[:] = rest[:best_k + 1] + segment + rest[best_k + 1:]
+                improved = True
+            else:
+                i += 1
+    return improved
+
+def solve_tour(matrix, start=0, end=None, loop_at_start=False, time_budget=LOCAL_SOLVER_TIME_BUDGET, initial_order=None):
+    """
+    Orders the nodes of a distance matrix into a short tour.
+    Nearest neighbour construction, then 2-opt and Or-opt passes until no move
+    improves the tour or the time budget runs out.
+
+    matrix = square matrix (nested lists or numpy array), matrix[i][j] is the cost from i to j
+    start = index of the node the tour starts from
+    end = index of the node the tour must finish on (ignored if loop_at_start)
+    loop_at_start = should the tour come back to start ?
+    time_budget = seconds allowed for the improvement phase
+    initial_order = optional previous visiting order of the nodes (start and end excluded)
+                    to improve instead of building a new tour, unknown nodes are dropped
+                    and nodes missing from it are appended by nearest neighbour
+
+    Returns the list of node indexes in visiting order, starting with start
+    (and finishing with end if given). The return leg of a loop is implicit.
+    """
+    dist = _as_rows(matrix)
+    if loop_at_start:
+        end = None
+    nodes = [node for node in range(len(dist)) if node != start and node != end]
+
+    if initial_order is None:
+        tour = nearest_neighbour_tour(dist, start, nodes)
+    else:
+        valid = set(nodes)
+        tour = [start] + [node for node in dict.fromkeys(initial_order) if node in valid]
+        left = [node for node in nodes if node not in set(tour)]
+        if left:
+            tour += nearest_neighbour_tour(dist, tour[-1], left)[1:]
+    fixed_end = end is not None
+    if fixed_end:
+        tour.append(end)
+
+    deadline = time.perf_counter() + time_budget
+    sym_dist = _symmetrized(dist) # 2-opt reverses legs, only exact on symmetric costs
+    best_cost = tour_cost(dist, tour, loop_at_start)
+    best_tour = list(tour)
+    while time.perf_counter() < deadline:
+        improved = two_opt(sym_dist, tour, fixed_end, loop_at_start, deadline)
+        improved = or_opt(dist, tour, fixed_end, loop_at_start, deadline) or improved
+        cost = tour_cost(dist, tour, loop_at_start)
+        if not improved or cost >= best_cost - EPSILON:
+            break
+        best_cost, best_tour = cost, list(tour)
+    return best_tour
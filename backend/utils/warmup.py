@@ -0,0 +1,66 @@
+# Log of the routes asked for, replayed in the background to warm the ORS, matrix and directions caches
+
+import asyncio
+import os
+from dotenv import load_dotenv
+
+import backend.database as db_module
+from backend.utils.constants import (WARMUP_LOG_TTL, WARMUP_LOG_MAX_ENTRIES, WARMUP_MAX_REQUESTS,
+                                     WARMUP_START_DELAY, WARMUP_PAUSE)
+from backend.utils.ors_cache import ResponseCache
+from backend.utils.ors_scheduler import background_priority, OrsQuotaExceeded
+
+def warmup_enabled() -> bool:
+    "ROUTE_WARMUP env variable, read when the app starts so the .env file is loaded first."
+    load_dotenv()
+    return os.getenv("ROUTE_WARMUP", "0").lower() in ("1", "true", "yes")
+
+request_log = ResponseCache(ttl=WARMUP_LOG_TTL, max_entries=WARMUP_LOG_MAX_ENTRIES, table="route_requests")
+
+def log_route_request(req):
+    "Remembers a /profiles/optimize request, repeated requests only refresh their entry."
+    params = req.model_dump()
+    request_log.set(request_log.make_key("route_request", params), params)
+
+async def warm_up(limit=WARMUP_MAX_REQUESTS, pause=WARMUP_PAUSE):
+    """
+    Replays the most recently logged requests one at a time, pausing between them,
+    so their clustering, optimization results, matrices and directions legs are cached
+    before the canvassers ask for them. Failures are logged and skipped.
+    Its ORS calls wait behind the interactive ones and stop short of the daily budget reserve.
+    Returns the number of requests replayed.
+    """
+    # Imported here, the routes module logs requests through this one
+    from backend.utils.routes.map_routes import RouteRequest, compute_route
+
+    if db_module.SessionLocal is None:
+        print("Route warm-up skipped : no database loaded")
+        return 0
+    logged = await asyncio.to_thread(request_log.recent, limit)
+    print(f"Route warm-up : {len(logged)} logged requests to replay")
+    replayed = 0
+    for params in logged:
+        try:
+            with background_priority():
+                await compute_route(RouteRequest(**params), open_sessions=False)
+            replayed += 1
+        except asyncio.CancelledError:
+            raise
+        except OrsQuotaExceeded as e:
+            print(f"Route warm-up stopped : {e}")
+            break
+        except Exception as e:
+            print(f"WARN Route warm-up skipped a request : {e!r}")
+        await asyncio.sleep(pause)
+    print(f"Route warm-up done : {replayed}/{len(logged)} requests replayed")
+    return replayed
+
+async def delayed_warm_up(delay=WARMUP_START_DELAY):
+    """
+    Background startup task, lets the app start serving before replaying.
+    The database is only loaded at the first login, the replay waits for it.
+    """
+    await asyncio.sleep(delay)
+    while db_module.SessionLocal is None:
+        await asyncio.sleep(delay)
+    await warm_up()
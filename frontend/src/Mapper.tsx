@@ -10,6 +10,7 @@ import CollapsePanel from "./components/CollapsePanel";
 import FilterPanel from "./components/FilterPanel";
 import MapPanel from "./components/MapPanel";
 import ProfilePanel from "./components/ProfilePanel";
+import { decodePolyline } from "./polyline";
 
 import "./App.css";
 
@@ -45,6 +46,33 @@ type Props = {
   goBack: () => void;
 };
 
+function decodeRoute(route: any): LatLng[] {
+  return route.polyline !== undefined
+    ? decodePolyline(route.polyline, route.precision)
+    : route.coordinates.map(([lon, lat]: [number, number]) => [lat, lon]);
+}
+
+function toMarkers(markers: any[]): Marker[] {
+  return markers.map((m: any, idx: number) => ({
+    position: [m.lat, m.lon] as [number, number],
+    color: m.color,
+    properties: {
+      index: idx + 1,
+      array_id: m.id,
+      name: m.name,
+      personality: m.personality,
+      arguments: m.arguments,
+      nbhood: m.nbhood,
+      preferred_language: m.preferred_language,
+      origin: m.origin,
+      political_scale: m.political_scale,
+      ideal_process: m.ideal_process,
+      strategic_profile: m.strategic_profile,
+      picture_url: m.picture_url,
+    },
+  }));
+}
+
 export default function Mapper({ goBack }: Props) {
   const API_BASE = import.meta.env.VITE_API_BASE;
   const [start, setStart] = useState<LatLng>([45.45, -73.64]);
@@ -107,46 +135,58 @@ export default function Mapper({ goBack }: Props) {
         }
       }
 
-      const payload = { start_lat: lat, start_lon: lon, filters: cleaned };
+      const payload = { start_lat: lat, start_lon: lon, filters: cleaned, geometry: "polyline" };
       console.log("Sending payload :",payload);
-      const res = await fetch(`${API_BASE}/profiles/optimize`, {
+      const res = await fetch(`${API_BASE}/profiles/optimize/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json", "ngrok-skip-browser-warning": "true" },
         body: JSON.stringify(payload),
       });
-      const data = await res.json();
-
-      if (!data || !data.route || !data.start) {
+      if (!res.ok || !res.body) {
+        const data = await res.json().catch(() => null);
         console.warn("No route returned:", data);
-        if (data?.message) alert(data.message);
+        alert(data?.detail ?? "Route planning failed");
         setRoute(null);
         setMarkers([]);
         return;
       }
 
-      setStart([data.start.lat, data.start.lon]);
-      const routeLatLng = data.route.coordinates.map(([lon2, lat2]: [number, number]) => [lat2, lon2]);
-      setRoute(routeLatLng);
-
-      const markerList = data.markers.map((m: any, idx: number) => ({
-        position: [m.lat, m.lon] as [number, number],
-        color: m.color,
-        properties: {
-          index: idx + 1,
-          array_id: m.id,
-          name: m.name,
-          personality: m.personality,
-          arguments: m.arguments,
-          nbhood: m.nbhood,
-          preferred_language: m.preferred_language,
-          origin: m.origin,
-          political_scale: m.political_scale,
-          ideal_process: m.ideal_process,
-          strategic_profile: m.strategic_profile,
-          picture_url: m.picture_url,
-        },
-      }));
-      setMarkers(markerList);
+      // NDJSON : markers first, then the route pieces in visiting order as they are computed
+      const pieces: LatLng[][] = [];
+      const handleEvent = (event: any) => {
+        if (event.type === "message") {
+          alert(event.message);
+          setRoute(null);
+          setMarkers([]);
+        } else if (event.type === "markers") {
+          setStart([event.start.lat, event.start.lon]);
+          setMarkers(toMarkers(event.markers));
+          setRoute(null);
+        } else if (event.type === "cluster") {
+          pieces.push(decodeRoute(event.route));
+          setRoute(pieces.flat());
+        } else if (event.type === "error") {
+          // The planning failed after the markers were sent
+          console.warn("Route planning failed:", event);
+          alert(event.detail ?? "Route planning failed");
+          setRoute(null);
+        }
+      };
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      for (;;) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value, { stream: !done });
+        const lines = buffer.split("\n");
+        buffer = lines.pop() ?? "";
+        for (const line of lines) {
+          if (line.trim()) handleEvent(JSON.parse(line));
+        }
+        if (done) break;
+      }
+      if (buffer.trim()) handleEvent(JSON.parse(buffer));
     } catch (err) {
       console.error("Failed to search:", err);
     } finally {
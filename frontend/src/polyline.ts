@@ -0,0 +1,30 @@
+// Decodes the Google encoded polylines returned by /profiles/optimize in "polyline" geometry mode
+
+type LatLng = [number, number];
+
+export function decodePolyline(encoded: string, precision = 5): LatLng[] {
+  const factor = Math.pow(10, precision);
+  const points: LatLng[] = [];
+  let index = 0;
+  let lat = 0;
+  let lon = 0;
+
+  const nextValue = () => {
+    let result = 0;
+    let shift = 0;
+    let byte: number;
+    do {
+      byte = encoded.charCodeAt(index++) - 63;
+      result |= (byte & 0x1f) << shift;
+      shift += 5;
+    } while (byte >= 0x20);
+    return result & 1 ? ~(result >> 1) : result >> 1;
+  };
+
+  while (index < encoded.length) {
+    lat += nextValue();
+    lon += nextValue();
+    points.push([lat / factor, lon / factor]);
+  }
+  return points;
+}